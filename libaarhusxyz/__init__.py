@@ -1,9 +1,18 @@
 from .xyzparser import parse
+from .xyzparser import parse_iter
+from .xyzparser import parse_many
+from .xyzparser import parse_header
+from .xyzparser import build_index
 from .xyzparser import dump
 from .xyz import XYZ
 from .gex import GEX
 from .survey import Survey
 
+from . import compression
+from . import cache
+from . import layerdata
+from . import profiling
+
 from .sr2 import parse as parse_sr2
 from .gex import parse as parse_gex
 from .gex import dump as dump_gex
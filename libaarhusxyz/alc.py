@@ -1,9 +1,13 @@
 import pandas as pd
 import re
 import pdb
+from . import compression
 
 
 def parse(nameorfile, xyz_columns=None):
+    if isinstance(nameorfile, str):
+        with compression.open_file(nameorfile, 'r') as f:
+            return parse(f, xyz_columns)
     df = pd.read_csv(nameorfile, sep=" *= *", header=None).rename(columns={0:"canonical_name", 1:"position"})
     filt = df.canonical_name.isin(["Version", "System", "ChannelsNumber", "Dummy"])
     meta = df.loc[filt].set_index("canonical_name")["position"].to_dict()
@@ -65,7 +69,7 @@ def _dump(xyz, f, columns=None):
 
 def dump(xyz, nameorfile, **kw):
     if isinstance(nameorfile, str):
-        with open(nameorfile, 'w') as f:
+        with compression.open_file(nameorfile, 'w') as f:
             return _dump(xyz, f, **kw)
     else:
         return _dump(xyz, nameorfile, **kw)
@@ -0,0 +1,128 @@
+"""On-disk cache of parsed XYZ files, used by parse(path, cache=True).
+
+Each entry is a .npy store (see libaarhusxyz.export.npy) in a
+subdirectory of the cache directory, named by a hash of the path,
+size and modification time of the XYZ (and ALC) file, optionally the
+file content, and the parse options. Entries are loaded memory mapped.
+When the cache grows beyond its maximum size, the least recently used
+entries are removed.
+"""
+
+import collections
+import hashlib
+import json
+import os
+import shutil
+import time
+from .export import npy
+
+DEFAULT_MAX_SIZE = 10 * 1024**3
+
+_DEFAULTS = {"engine": "auto", "nan_dummy": False}
+
+_stats = collections.Counter()
+
+def default_dir():
+    return os.path.join(os.environ.get("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+                        "libaarhusxyz")
+
+def stats():
+    """Returns the number of cache hits, misses and evicted entries
+    in this process."""
+    return {"hits": _stats["hits"], "misses": _stats["misses"], "evictions": _stats["evictions"]}
+
+def _file_key(filename, content_hash=False):
+    stat = os.stat(filename)
+    res = {"path": os.path.abspath(filename), "size": stat.st_size, "mtime": stat.st_mtime_ns}
+    if content_hash:
+        digest = hashlib.sha1()
+        with open(filename, "rb") as f:
+            for block in iter(lambda: f.read(1024*1024), b""):
+                digest.update(block)
+        res["sha1"] = digest.hexdigest()
+    return res
+
+def key(filename, options, content_hash=False):
+    """Returns the cache key of parsing filename with options (the
+    keyword arguments to parse())."""
+    # Arguments left at their defaults, and the number of workers, don't change the parsed model
+    options = {name: value for name, value in options.items()
+               if value is not None and name != "workers" and not (name in _DEFAULTS and value == _DEFAULTS[name])}
+    alcfile = options.pop("alcfile", None)
+    data = {"xyz": _file_key(filename, content_hash),
+            "alc": _file_key(alcfile, content_hash) if alcfile is not None else None,
+            "options": options}
+    return hashlib.sha1(json.dumps(data, sort_keys=True, default=repr).encode("utf-8")).hexdigest()
+
+def _entry_size(path):
+    return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+
+def evict(cache_dir, max_size=DEFAULT_MAX_SIZE):
+    """Removes the least recently used entries of cache_dir until its
+    total size is at most max_size bytes."""
+    entries = []
+    for name in os.listdir(cache_dir):
+        path = os.path.join(cache_dir, name)
+        if ".tmp-" in name:
+            # Left behind by a process that died while writing an entry
+            try:
+                if os.stat(path).st_mtime < time.time() - 3600:
+                    shutil.rmtree(path, ignore_errors=True)
+            except OSError:
+                pass
+            continue
+        if not os.path.isdir(path) or not os.path.exists(os.path.join(path, npy.META_FILE)):
+            continue
+        try:
+            entries.append((os.stat(path).st_mtime, _entry_size(path), path))
+        except OSError:
+            # Removed by another process
+            pass
+    total = sum(size for mtime, size, path in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        total -= size
+        _stats["evictions"] += 1
+
+def clear(cache_dir=None):
+    """Removes all entries of cache_dir (default default_dir())."""
+    cache_dir = cache_dir or default_dir()
+    if os.path.isdir(cache_dir):
+        evict(cache_dir, 0)
+
+def cached_parse(parse, filename, cache_dir=None, max_size=DEFAULT_MAX_SIZE, content_hash=False, **kw):
+    """Returns parse(filename, **kw), from cache_dir (default
+    default_dir()) if possible. Results for ALC files given as file
+    objects are not cached."""
+    if kw.get("alcfile") is not None and not isinstance(kw["alcfile"], str):
+        return parse(filename, **kw)
+    cache_dir = cache_dir or default_dir()
+    entry = os.path.join(cache_dir, key(filename, kw, content_hash))
+
+    if os.path.exists(os.path.join(entry, npy.META_FILE)):
+        try:
+            os.utime(entry)
+            model = npy.load(entry, mmap=True)
+        except (OSError, ValueError):
+            # Evicted by another process while loading
+            model = None
+        if model is not None:
+            _stats["hits"] += 1
+            model["file_meta"]["cache"] = "hit"
+            return model
+
+    _stats["misses"] += 1
+    model = parse(filename, **kw)
+    tmp = "%s.tmp-%s-%s" % (entry, os.getpid(), time.monotonic_ns())
+    try:
+        npy.dump(model, tmp)
+        os.replace(tmp, entry)
+    except (OSError, ValueError):
+        # Another process already wrote the same entry, the cache is not writable, or the model can not be stored
+        shutil.rmtree(tmp, ignore_errors=True)
+    else:
+        evict(cache_dir, max_size)
+    model["file_meta"]["cache"] = "miss"
+    return model
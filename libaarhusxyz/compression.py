@@ -0,0 +1,135 @@
+"""Transparent (de)compression of files read and written by
+libaarhusxyz. The codec is detected from the magic bytes of the file
+when reading, and from the file extension when writing.
+
+zstd support requires the zstandard package.
+"""
+
+import builtins
+import bz2
+import gzip
+import io
+import lzma
+import os
+try:
+    import zstandard
+except:
+    zstandard = None
+
+CODECS = ("gzip", "bz2", "xz", "zstd")
+
+_EXTENSIONS = {".gz": "gzip",
+               ".gzip": "gzip",
+               ".bz2": "bz2",
+               ".xz": "xz",
+               ".lzma": "xz",
+               ".zst": "zstd",
+               ".zstd": "zstd"}
+
+_MAGIC = [(b"\x1f\x8b", "gzip"),
+          (b"BZh", "bz2"),
+          (b"\xfd7zXZ\x00", "xz"),
+          (b"\x28\xb5\x2f\xfd", "zstd")]
+
+_BLOCKSIZE = 1024*1024
+
+def detect(filename, mode="r"):
+    """Returns the codec of filename (one of CODECS), or None if it is
+    not compressed. Existing files opened for reading are detected
+    from their magic bytes, anything else from the file extension."""
+    if "r" in mode and os.path.exists(filename):
+        with builtins.open(filename, "rb") as f:
+            magic = f.read(6)
+        for prefix, codec in _MAGIC:
+            if magic.startswith(prefix):
+                return codec
+        return None
+    return _EXTENSIONS.get(os.path.splitext(filename)[1].lower())
+
+def strip_extension(filename):
+    """Returns filename without any compression extension."""
+    base, ext = os.path.splitext(filename)
+    if ext.lower() in _EXTENSIONS:
+        return base
+    return filename
+
+class _ZstdReader(io.RawIOBase):
+    """Seekable zstd decompressing reader. Like gzip.GzipFile, seeking
+    backwards restarts decompression from the start of the file."""
+    def __init__(self, filename):
+        self.filename = filename
+        self._f = None
+        self._rewind()
+
+    def _rewind(self):
+        if self._f is not None:
+            self._f.close()
+        self._f = builtins.open(self.filename, "rb")
+        self._reader = zstandard.ZstdDecompressor().stream_reader(self._f)
+        self._pos = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def readinto(self, b):
+        n = self._reader.readinto(b)
+        self._pos += n
+        return n
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            while self.read(_BLOCKSIZE):
+                pass
+            offset += self._pos
+        if offset < self._pos:
+            self._rewind()
+        while self._pos < offset:
+            if not self.read(min(_BLOCKSIZE, offset - self._pos)):
+                break
+        return self._pos
+
+    def close(self):
+        if self._f is not None:
+            self._f.close()
+            self._f = None
+        super().close()
+
+def _check_zstandard():
+    if zstandard is None:
+        raise ImportError("Reading and writing zstd compressed files requires the zstandard package")
+
+def open_file(filename, mode="r", threads=-1, **kw):
+    """Like open(), but transparently decompresses / compresses
+    filename, see detect(). threads is the number of compression
+    threads for codecs that support it (zstd), -1 meaning one per
+    CPU. Any other arguments are passed to the text wrapper in text
+    mode (e.g. encoding)."""
+    codec = detect(filename, mode)
+    if codec is None:
+        return builtins.open(filename, mode, **kw)
+    binary_mode = mode.replace("t", "")
+    if "b" not in binary_mode:
+        binary_mode += "b"
+    if codec == "gzip":
+        f = gzip.open(filename, binary_mode)
+    elif codec == "bz2":
+        f = bz2.open(filename, binary_mode)
+    elif codec == "xz":
+        f = lzma.open(filename, binary_mode)
+    else:
+        _check_zstandard()
+        if "r" in mode:
+            f = io.BufferedReader(_ZstdReader(filename))
+        else:
+            f = zstandard.open(filename, binary_mode, cctx=zstandard.ZstdCompressor(threads=threads))
+    if "b" in mode:
+        return f
+    return io.TextIOWrapper(f, **kw)
@@ -0,0 +1,167 @@
+"""Columnar Parquet and Arrow IPC (Feather) storage of XYZ models.
+
+Flightlines columns are stored as table columns, and each layer_data
+group as a single fixed size list column named after the group.
+model_info, file_meta, alc_info and the layer labels and dtypes of
+each group are stored as JSON in the schema metadata.
+"""
+
+import json
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather
+import pyarrow.ipc
+import pyarrow.parquet as pq
+from .. import profiling
+
+METADATA_KEY = b"libaarhusxyz"
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+def _column(series):
+    try:
+        return pa.array(series, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Mixed object columns, e.g. text with some numbers
+        return pa.array(series.astype(str).where(series.notna()), from_pandas=True)
+
+def _layer_column(df):
+    values = df.to_numpy()
+    if values.dtype == object:
+        values = values.astype(float)
+    return pa.FixedSizeListArray.from_arrays(pa.array(values.ravel()), values.shape[1])
+
+def to_table(model):
+    """Converts an XYZ object or model dictionary to a pyarrow.Table."""
+    model_dict = getattr(model, "model_dict", model)
+    flightlines = model_dict["flightlines"]
+    layer_data = model_dict["layer_data"]
+
+    clashes = set(flightlines.columns).intersection(layer_data.keys())
+    if clashes:
+        raise ValueError("Layer data keys clash with flightlines columns: %s" % ", ".join(sorted(clashes)))
+
+    names = [str(col) for col in flightlines.columns] + list(layer_data.keys())
+    arrays = ([_column(flightlines[col]) for col in flightlines.columns]
+              + [_layer_column(df) for df in layer_data.values()])
+
+    meta = {"model_info": model_dict.get("model_info", {}),
+            "file_meta": model_dict.get("file_meta", {}),
+            "layer_data": {key: list(df.columns) for key, df in layer_data.items()},
+            "layer_dtypes": {key: [str(dtype) for dtype in df.dtypes] for key, df in layer_data.items()}}
+    if "alc_info" in model_dict:
+        meta["alc_info"] = model_dict["alc_info"]
+
+    return pa.Table.from_arrays(arrays, names=names).replace_schema_metadata(
+        {METADATA_KEY: json.dumps(meta, default=_json_default).encode("utf-8")})
+
+def _read_meta(schema):
+    meta = schema.metadata or {}
+    if METADATA_KEY not in meta:
+        raise ValueError("Not a libaarhusxyz table")
+    return json.loads(meta[METADATA_KEY])
+
+def _projection(schema, columns=None, layer_groups=None):
+    """Returns the table columns to read for the given flightlines
+    columns and layer_data groups (None for all of them)."""
+    meta = _read_meta(schema)
+    layer_keys = list(meta["layer_data"].keys())
+    flightlines_cols = [name for name in schema.names if name not in meta["layer_data"]]
+    if columns is not None:
+        missing = [col for col in columns if col not in flightlines_cols]
+        if missing:
+            raise ValueError("Unknown columns: %s" % ", ".join(missing))
+        flightlines_cols = [col for col in flightlines_cols if col in columns]
+    if layer_groups is not None:
+        missing = [key for key in layer_groups if key not in meta["layer_data"]]
+        if missing:
+            raise ValueError("Unknown layer groups: %s" % ", ".join(missing))
+        layer_keys = [key for key in layer_keys if key in layer_groups]
+    return flightlines_cols + layer_keys
+
+def from_table(table):
+    """Converts a pyarrow.Table written by to_table() (or a column
+    projection of one) back to a model dictionary."""
+    meta = _read_meta(table.schema)
+    layer_keys = [key for key in meta["layer_data"] if key in table.column_names]
+
+    flightlines = table.drop(layer_keys).to_pandas()
+    layer_data = {}
+    for key in layer_keys:
+        column = table.column(key).combine_chunks()
+        labels = meta["layer_data"][key]
+        values = column.flatten().to_numpy(zero_copy_only=False).reshape((len(column), len(labels)))
+        layer_data[key] = pd.DataFrame(values, columns=labels)
+        # Groups with mixed dtypes are stored as a single list type, so restore integer / boolean columns
+        dtypes = {label: dtype for label, dtype in zip(labels, meta.get("layer_dtypes", {}).get(key, []))
+                  if dtype != str(values.dtype) and np.dtype(dtype).kind in "iub"}
+        if dtypes:
+            layer_data[key] = layer_data[key].astype(dtypes)
+
+    res = {"flightlines": flightlines,
+           "layer_data": layer_data,
+           "model_info": meta["model_info"],
+           "file_meta": meta["file_meta"]}
+    if "alc_info" in meta:
+        res["alc_info"] = meta["alc_info"]
+    return res
+
+def dump_parquet(model, nameorfile, **kw):
+    """Write an XYZ object or model dictionary to a Parquet file. Any
+    other arguments (e.g. row_group_size, compression) are passed to
+    pyarrow.parquet.write_table()."""
+    model_dict = getattr(model, "model_dict", model)
+    with profiling.stage("export.parquet", rows=len(model_dict["flightlines"])):
+        pq.write_table(to_table(model), nameorfile, **kw)
+
+def load_parquet(nameorfile, columns=None, layer_groups=None, row_groups=None):
+    """Read a Parquet file written by dump_parquet() into a model
+    dictionary.
+
+    columns, layer_groups: optional lists of flightlines columns and
+    layer_data groups to read (default all of them).
+
+    row_groups: optional list of row group indices to read (default
+    all of them).
+    """
+    f = pq.ParquetFile(nameorfile)
+    read_columns = _projection(f.schema_arrow, columns, layer_groups)
+    if row_groups is None:
+        table = f.read(columns=read_columns)
+    else:
+        table = f.read_row_groups(row_groups, columns=read_columns)
+    return from_table(table)
+
+def dump_feather(model, nameorfile, **kw):
+    """Write an XYZ object or model dictionary to an Arrow IPC
+    (Feather v2) file. Any other arguments (e.g. chunksize,
+    compression) are passed to pyarrow.feather.write_feather()."""
+    model_dict = getattr(model, "model_dict", model)
+    with profiling.stage("export.feather", rows=len(model_dict["flightlines"])):
+        pyarrow.feather.write_feather(to_table(model), nameorfile, **kw)
+
+def load_feather(nameorfile, columns=None, layer_groups=None, row_groups=None):
+    """Read an Arrow IPC (Feather v2) file written by dump_feather()
+    into a model dictionary. The file is memory mapped when nameorfile
+    is a path.
+
+    columns, layer_groups: as for load_parquet().
+
+    row_groups: optional list of record batch indices to read (default
+    all of them).
+    """
+    source = pa.memory_map(nameorfile) if isinstance(nameorfile, str) else nameorfile
+    reader = pyarrow.ipc.open_file(source)
+    read_columns = _projection(reader.schema, columns, layer_groups)
+    if row_groups is None:
+        batches = [reader.get_batch(idx) for idx in range(reader.num_record_batches)]
+    else:
+        batches = [reader.get_batch(idx) for idx in row_groups]
+    table = pa.Table.from_batches(batches, schema=reader.schema).select(read_columns)
+    return from_table(table)
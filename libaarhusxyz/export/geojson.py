@@ -1,6 +1,7 @@
 import geopandas as gpd
 import shapely.geometry.linestring
 import json
+from .. import profiling
 
 
 def to_geojson_str(model, simplify=None):
@@ -25,9 +26,10 @@ def _dump(model, f, simplify=None):
         to_geojson_str(model, simplify=simplify))
 
 def dump(model, nameorfile, simplify=None):
-    if isinstance(nameorfile, str):
-        with open(nameorfile, 'w') as f:
-            _dump(model, f, simplify=simplify)
-    else:
-        _dump(model, nameorfile, simplify=simplify)
+    with profiling.stage("export.geojson", rows=len(model.flightlines)):
+        if isinstance(nameorfile, str):
+            with open(nameorfile, 'w') as f:
+                _dump(model, f, simplify=simplify)
+        else:
+            _dump(model, nameorfile, simplify=simplify)
  
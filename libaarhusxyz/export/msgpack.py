@@ -1,3 +1,4 @@
+import collections.abc
 import pandas as pd
 import numpy as np
 import msgpack
@@ -5,6 +6,7 @@ import msgpack_numpy as m
 m.patch()
 
 from . import geojson
+from .. import profiling
 
 def coerce(s):
     if s.dtype != "O":
@@ -18,7 +20,7 @@ def df2dict(df):
     return {col: coerce(df[col]).values for col in df.columns}
 
 def dfs2dict(d):    
-    if isinstance(d, dict):
+    if isinstance(d, collections.abc.Mapping):
         return {key: dfs2dict(value) for key, value in d.items()}
     elif isinstance(d, pd.DataFrame):
         return df2dict(d)
@@ -45,11 +47,12 @@ def _dump(model, f, gex=None):
     msgpack.dump(data, f)
 
 def dump(model, nameorfile, gex=None):
-    if isinstance(nameorfile, str):
-        with open(nameorfile, 'wb') as f:
-            _dump(model, f, gex=gex)
-    else:
-        _dump(model, nameorfile, gex=gex)
+    with profiling.stage("export.msgpack", rows=len(model.flightlines)):
+        if isinstance(nameorfile, str):
+            with open(nameorfile, 'wb') as f:
+                _dump(model, f, gex=gex)
+        else:
+            _dump(model, nameorfile, gex=gex)
 
 def _load(f, return_gex=False):
     from .. import xyz
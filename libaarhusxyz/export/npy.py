@@ -0,0 +1,141 @@
+"""Native on-disk store of XYZ models: a directory with one .npy file
+per flightlines column, one 2-D .npy file per layer_data group and
+model.json, holding model_info, file_meta, alc_info and the column
+names.
+
+Numeric columns are memory mapped (copy on write) when loaded with
+mmap=True, so that DataFrames are backed by the files without reading
+them, and processes loading the same store share the page cache. Text
+columns are stored as fixed width unicode and always read into memory.
+"""
+
+import json
+import os
+import numpy as np
+import pandas as pd
+from .. import profiling
+
+META_FILE = "model.json"
+
+def _json_default(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
+
+def _save_column(directory, filename, values):
+    """Saves a flightlines column and returns its description for
+    model.json."""
+    res = {"file": filename}
+    if values.dtype.kind not in "biufcmM":
+        na = pd.isna(values)
+        values = np.where(na, "", values).astype(str)
+        res["text"] = True
+        if na.any():
+            res["na"] = filename[:-len(".npy")] + ".na.npy"
+            np.save(os.path.join(directory, res["na"]), na)
+    np.save(os.path.join(directory, filename), values)
+    return res
+
+def _load_column(directory, desc, mmap_mode):
+    if not desc.get("text"):
+        return np.load(os.path.join(directory, desc["file"]), mmap_mode=mmap_mode)
+    values = np.load(os.path.join(directory, desc["file"])).astype(object)
+    if "na" in desc:
+        values[np.load(os.path.join(directory, desc["na"]))] = np.nan
+    return values
+
+def dump(model, directory):
+    """Write an XYZ object or model dictionary to the store directory,
+    creating it if needed."""
+    model_dict = getattr(model, "model_dict", model)
+    with profiling.stage("export.npy", rows=len(model_dict["flightlines"])):
+        _dump(model_dict, directory)
+
+def _dump(model_dict, directory):
+    os.makedirs(directory, exist_ok=True)
+
+    flightlines = []
+    for idx, col in enumerate(model_dict["flightlines"].columns):
+        desc = _save_column(directory, "flightlines_%d.npy" % idx, model_dict["flightlines"][col].to_numpy())
+        flightlines.append(dict(desc, name=col))
+
+    layer_data = {}
+    for idx, (key, df) in enumerate(model_dict["layer_data"].items()):
+        filename = "layer_data_%d.npy" % idx
+        layer_data[key] = {"file": filename,
+                           "columns": list(df.columns),
+                           "dtypes": [str(dtype) for dtype in df.dtypes]}
+        values = df.to_numpy()
+        if values.dtype == object:
+            try:
+                values = values.astype(float)
+            except ValueError:
+                values = values.astype(str)
+                layer_data[key]["text"] = True
+        np.save(os.path.join(directory, filename), np.ascontiguousarray(values))
+
+    meta = {"model_info": model_dict.get("model_info", {}),
+            "file_meta": model_dict.get("file_meta", {}),
+            "flightlines": flightlines,
+            "layer_data": layer_data}
+    if "alc_info" in model_dict:
+        meta["alc_info"] = model_dict["alc_info"]
+    with open(os.path.join(directory, META_FILE), "w") as f:
+        json.dump(meta, f, default=_json_default)
+
+def load_meta(directory):
+    """Read model.json of a store written by dump()."""
+    with open(os.path.join(directory, META_FILE)) as f:
+        return json.load(f)
+
+def load(directory, mmap=True, columns=None, layer_groups=None):
+    """Read a store written by dump() into a model dictionary.
+
+    mmap: memory map the numeric data instead of reading it.
+
+    columns, layer_groups: optional lists of flightlines columns and
+    layer_data groups to load (default all of them).
+    """
+    meta = load_meta(directory)
+    mmap_mode = "c" if mmap else None
+
+    flightlines_descs = meta["flightlines"]
+    if columns is not None:
+        missing = set(columns) - set(desc["name"] for desc in flightlines_descs)
+        if missing:
+            raise ValueError("Unknown columns: %s" % ", ".join(sorted(missing)))
+        flightlines_descs = [desc for desc in flightlines_descs if desc["name"] in columns]
+    layer_descs = meta["layer_data"]
+    if layer_groups is not None:
+        missing = set(layer_groups) - set(layer_descs.keys())
+        if missing:
+            raise ValueError("Unknown layer groups: %s" % ", ".join(sorted(missing)))
+        layer_descs = {key: desc for key, desc in layer_descs.items() if key in layer_groups}
+
+    # copy=False keeps one block per column, backed by the memory map
+    flightlines = pd.DataFrame({desc["name"]: _load_column(directory, desc, mmap_mode)
+                                for desc in flightlines_descs},
+                               columns=[desc["name"] for desc in flightlines_descs], copy=False)
+
+    layer_data = {}
+    for key, desc in layer_descs.items():
+        if desc.get("text"):
+            values = np.load(os.path.join(directory, desc["file"])).astype(object)
+        else:
+            values = np.load(os.path.join(directory, desc["file"]), mmap_mode=mmap_mode)
+        if len(set(desc["dtypes"])) > 1:
+            # Mixed dtype groups are stored as a single block, so restore the original column dtypes
+            layer_data[key] = pd.DataFrame(values, columns=desc["columns"]).astype(
+                dict(zip(desc["columns"], desc["dtypes"])))
+        else:
+            layer_data[key] = pd.DataFrame(values, columns=desc["columns"], copy=False)
+
+    res = {"flightlines": flightlines,
+           "layer_data": layer_data,
+           "model_info": meta["model_info"],
+           "file_meta": meta["file_meta"]}
+    if "alc_info" in meta:
+        res["alc_info"] = meta["alc_info"]
+    return res
@@ -1,5 +1,6 @@
 import pandas as pd
 import libaarhusxyz
+from .. import profiling
 import numpy as np
 
 from scipy.interpolate import interp1d
@@ -164,8 +165,9 @@ def _dump(model, fid, attr_out = ['resistivity', 'resistivity_variance_factor','
         attr_out)
 
 def dump(model, nameorfile, **kw):
-    if isinstance(nameorfile, str):
-        with open(nameorfile, 'w') as f:
-            return _dump(model, f, **kw)
-    else:
-        return _dump(model, nameorfile, **kw)
+    with profiling.stage("export.vtk", rows=len(model.flightlines)):
+        if isinstance(nameorfile, str):
+            with open(nameorfile, 'w') as f:
+                return _dump(model, f, **kw)
+        else:
+            return _dump(model, nameorfile, **kw)
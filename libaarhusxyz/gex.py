@@ -7,6 +7,7 @@ import warnings
 
 import numpy as np
 from datetime import datetime
+from . import compression
 import matplotlib.pyplot as plt
 
 
@@ -97,7 +98,7 @@ def _parse(inputfile):
 
 def parse(nameorfile, **kw):
     if isinstance(nameorfile, str):
-        with open(nameorfile, 'r') as f:
+        with compression.open_file(nameorfile, 'r') as f:
             return _parse(f, **kw)
     else:
         return _parse(nameorfile, **kw)
@@ -159,7 +160,7 @@ def _dump(gex, f, columns=None):
 
 def dump(gex, nameorfile, **kw):
     if isinstance(nameorfile, str):
-        with open(nameorfile, 'wb') as f:
+        with compression.open_file(nameorfile, 'wb') as f:
             return _dump(gex, f, **kw)
     else:
         return _dump(gex, nameorfile, **kw)
@@ -0,0 +1,280 @@
+"""Array backed storage of layer_data.
+
+LayerData is a dict-like replacement for the dictionary of DataFrames
+in XYZ.layer_data. Groups with the same layer labels and dtype are
+stored together in one contiguous (soundings x layers x groups)
+array, with a row index shared by all groups, so that row
+permutations, selections and concatenation are one array operation
+per block instead of one DataFrame operation per group.
+
+xyz.layer_data[key] returns a DataFrame backed by (a view of) the
+block, and assigning a DataFrame with the same index, layer labels
+and dtype writes it back into the block. Other assignments store the
+DataFrame as is, next to the blocks, with rows selected by label if
+its index differs from that of the blocks; pack() moves them into
+blocks again.
+
+LazyLayerData is the dict-like layer_data of XYZ(..., lazy=True),
+which reads each group when it is first accessed.
+"""
+
+import collections.abc
+import numpy as np
+import pandas as pd
+
+class _Block(object):
+    def __init__(self, values, columns, keys):
+        self.values = values
+        self.columns = columns
+        self.keys = keys
+
+def _block_signature(df):
+    dtypes = set(df.dtypes)
+    if len(dtypes) != 1:
+        return None
+    dtype = dtypes.pop()
+    if not isinstance(dtype, np.dtype) or dtype.kind not in "biuf":
+        return None
+    return (tuple(df.columns), dtype)
+
+class LayerData(collections.abc.MutableMapping):
+    def __init__(self, layer_data=None, index=None):
+        self.index = index
+        self._blocks = []
+        self._where = {}
+        self._frames = {}
+        self._views = {}
+        self._order = []
+        self._pack(dict(layer_data or {}))
+
+    def _pack(self, layer_data):
+        if self.index is None:
+            self.index = next(iter(layer_data.values())).index if layer_data else pd.RangeIndex(0)
+        groups = {}
+        for key, df in layer_data.items():
+            signature = _block_signature(df) if df.index.equals(self.index) else None
+            if signature is None:
+                self._frames[key] = df
+            else:
+                groups.setdefault(signature, []).append(key)
+            self._order.append(key)
+        for (columns, dtype), keys in groups.items():
+            values = np.empty((len(self.index), len(columns), len(keys)), dtype=dtype)
+            for pos, key in enumerate(keys):
+                values[:, :, pos] = layer_data[key].to_numpy()
+            self._add_block(values, layer_data[keys[0]].columns, keys)
+
+    def _add_block(self, values, columns, keys):
+        block = _Block(values, columns, list(keys))
+        self._blocks.append(block)
+        for pos, key in enumerate(keys):
+            self._where[key] = (block, pos)
+
+    @property
+    def blocks(self):
+        """The (values, layer labels, group keys) of each block."""
+        return [(block.values, block.columns, [key for key in block.keys if key in self._where])
+                for block in self._blocks]
+
+    def __getitem__(self, key):
+        if key in self._frames:
+            return self._frames[key]
+        if key not in self._views:
+            block, pos = self._where[key]
+            self._views[key] = pd.DataFrame(block.values[:, :, pos], index=self.index,
+                                            columns=block.columns, copy=False)
+        return self._views[key]
+
+    def __setitem__(self, key, df):
+        if key in self._where:
+            block, pos = self._where[key]
+            if df.index.equals(self.index) and _block_signature(df) == (tuple(block.columns), block.values.dtype):
+                # Views modified in place are already stored, unless pandas had to replace their data
+                if df is not self._views.get(key) or not np.may_share_memory(df.to_numpy(), block.values):
+                    block.values[:, :, pos] = df.to_numpy()
+                    self._views.pop(key, None)
+                return
+            del self._where[key]
+            self._views.pop(key, None)
+        elif key not in self._frames:
+            self._order.append(key)
+        self._frames[key] = df
+
+    def __delitem__(self, key):
+        if key in self._where:
+            del self._where[key]
+            self._views.pop(key, None)
+        else:
+            del self._frames[key]
+        self._order.remove(key)
+
+    def __iter__(self):
+        return iter(list(self._order))
+
+    def __len__(self):
+        return len(self._order)
+
+    def __contains__(self, key):
+        return key in self._where or key in self._frames
+
+    def __repr__(self):
+        return "LayerData(%s)" % ", ".join(
+            "%s: %s" % (key, "x".join(str(size) for size in self[key].shape)) for key in self)
+
+    def to_dict(self):
+        """Returns a plain dictionary of DataFrames."""
+        return {key: self[key] for key in self}
+
+    def pack(self):
+        """Returns a copy with all groups with matching layer labels
+        and dtype (again) stored in blocks."""
+        return type(self)({key: self[key] for key in self})
+
+    def _with_rows(self, positions, index):
+        res = type(self)(index=index)
+        res._order = list(self._order)
+        for block in self._blocks:
+            live = [(pos, key) for pos, key in enumerate(block.keys) if self._where.get(key, (None,))[0] is block]
+            if not live:
+                continue
+            values = block.values
+            if len(live) < len(block.keys):
+                values = values[:, :, [pos for pos, key in live]]
+            res._add_block(values.take(positions, axis=0), block.columns, [key for pos, key in live])
+        for key, df in self._frames.items():
+            if df.index.equals(self.index):
+                res._frames[key] = df.iloc[positions].set_axis(index)
+            else:
+                # Matched by label, as DataFrame.reindex()
+                res._frames[key] = df.reindex(self.index[positions]).set_axis(index)
+        return res
+
+    def take(self, positions):
+        """Returns the rows at positions (integers, or a boolean mask)."""
+        positions = np.asarray(positions)
+        if positions.dtype == bool:
+            positions = np.flatnonzero(positions)
+        return self._with_rows(positions, self.index[positions])
+
+    def reindex(self, index):
+        """Returns the rows with the labels index, as DataFrame.reindex()
+        (except that all labels must exist)."""
+        index = pd.Index(index)
+        positions = self.index.get_indexer(index)
+        if (positions < 0).any():
+            raise KeyError("Labels not in index: %s" % list(index[positions < 0]))
+        return self._with_rows(positions, index)
+
+    def reset_index(self, drop=True):
+        """Returns a copy with a RangeIndex."""
+        return self._with_rows(np.arange(len(self.index)), pd.RangeIndex(len(self.index)))
+
+    def copy(self):
+        return self._with_rows(np.arange(len(self.index)), self.index)
+
+def take(layer_data, positions):
+    """Returns the rows at positions of layer_data, either a LayerData
+    or a dictionary of DataFrames, with a reset index."""
+    if isinstance(layer_data, LayerData):
+        positions = np.asarray(positions)
+        if positions.dtype == bool:
+            positions = np.flatnonzero(positions)
+        return layer_data._with_rows(positions, pd.RangeIndex(len(positions)))
+    return {key: df.iloc[positions].reset_index(drop=True) for key, df in layer_data.items()}
+
+def concat(layer_datas):
+    """Concatenates the rows of several LayerData objects (or
+    dictionaries of DataFrames). Returns a LayerData if all of them
+    are, with a single concatenation per block when they share the
+    same block layout."""
+    layer_datas = list(layer_datas)
+    if layer_datas and all(isinstance(layer_data, LayerData) for layer_data in layer_datas):
+        layouts = [[(tuple(columns), values.dtype, tuple(keys), values.shape[2]) for values, columns, keys in layer_data.blocks]
+                   for layer_data in layer_datas]
+        if (all(layout == layouts[0] for layout in layouts)
+            and all(len(keys) == nslots for columns, dtype, keys, nslots in layouts[0])
+            and not any(layer_data._frames for layer_data in layer_datas)):
+            res = LayerData(index=layer_datas[0].index.append([layer_data.index for layer_data in layer_datas[1:]]))
+            res._order = list(layer_datas[0]._order)
+            for idx, (values, columns, keys) in enumerate(layer_datas[0].blocks):
+                res._add_block(np.concatenate([layer_data.blocks[idx][0] for layer_data in layer_datas]),
+                               columns, keys)
+            return res
+    keys = []
+    for layer_data in layer_datas:
+        keys.extend(key for key in layer_data.keys() if key not in keys)
+    res = {key: pd.concat([layer_data[key] for layer_data in layer_datas if key in layer_data])
+           for key in keys}
+    if layer_datas and all(isinstance(layer_data, LayerData) for layer_data in layer_datas):
+        return LayerData(res)
+    return res
+
+class LazyLayerData(collections.abc.MutableMapping):
+    """layer_data of XYZ(..., lazy=True): a dictionary of DataFrames,
+    of which each group is only read, by load(list of keys) returning
+    a dictionary of DataFrames, when first accessed.
+
+    Groups are read as stored in the file, so rows of flightlines
+    should not be reordered or removed while groups are still
+    unloaded. load() reads all remaining groups in one pass."""
+    def __init__(self, keys, load):
+        self._keys = list(keys)
+        self._load = load
+        self._loaded = {}
+
+    @property
+    def loaded(self):
+        """The keys of the groups read so far."""
+        return [key for key in self._keys if key in self._loaded]
+
+    def load(self, keys=None):
+        """Reads the groups keys (default all) that are not yet loaded."""
+        keys = [key for key in (self._keys if keys is None else keys) if key not in self._loaded]
+        missing = [key for key in keys if key not in self._keys]
+        if missing:
+            raise KeyError(missing[0])
+        if keys:
+            self._loaded.update(self._load(keys))
+
+    def __getitem__(self, key):
+        if key not in self._loaded:
+            self.load([key])
+        return self._loaded[key]
+
+    def __setitem__(self, key, df):
+        if key not in self._keys:
+            self._keys.append(key)
+        self._loaded[key] = df
+
+    def __delitem__(self, key):
+        if key not in self._keys:
+            raise KeyError(key)
+        self._keys.remove(key)
+        self._loaded.pop(key, None)
+
+    def __iter__(self):
+        return iter(list(self._keys))
+
+    def __len__(self):
+        return len(self._keys)
+
+    def __contains__(self, key):
+        return key in self._keys
+
+    def __repr__(self):
+        return "LazyLayerData(%s)" % ", ".join(
+            "%s: %s" % (key, "x".join(str(size) for size in self._loaded[key].shape)
+                        if key in self._loaded else "not loaded")
+            for key in self._keys)
+
+    def values(self):
+        self.load()
+        return collections.abc.MutableMapping.values(self)
+
+    def items(self):
+        self.load()
+        return collections.abc.MutableMapping.items(self)
+
+    def to_dict(self):
+        """Returns a plain dictionary of DataFrames (reading all groups)."""
+        return dict(self.items())
@@ -2,9 +2,17 @@ import pandas as pd
 import numpy as np
 import pyproj
 import re
+import weakref
+import concurrent.futures
+import threading
+import functools
+import os
 import datetime
 import csv
+import json
 import pkg_resources
+from . import layerdata
+from . import profiling
 
 def _read_csv(f):
     return pd.read_csv(f)
@@ -28,13 +36,28 @@ complete_name_mapping(name_mapping)
 with pkg_resources.resource_stream("libaarhusxyz", "normalizer_pattern.csv") as f:
     name_mapping_patterns = _read_csv(f)
 
+def _compile_name_patterns(patterns):
+    """Returns the compiled patterns, their replacements and a single
+    regex with one named alternative per pattern, so that the first
+    matching pattern is found with one match() call."""
+    compiled = [re.compile(pattern) for pattern in patterns.pattern]
+    combined = re.compile("|".join("(?P<_p%d>%s)" % (idx, pattern.pattern)
+                                   for idx, pattern in enumerate(compiled)))
+    return compiled, list(patterns.replacement), combined
+
+_name_patterns, _name_replacements, _name_patterns_combined = _compile_name_patterns(name_mapping_patterns)
+
+@functools.lru_cache(maxsize=4096)
 def map_name_pattern(value):
-    for idx, row in name_mapping_patterns.iterrows():
-        if re.match(row.pattern, value):
-            return re.sub(row.pattern, row.replacement, value)
-    return value
+    match = _name_patterns_combined.match(value)
+    if match is None:
+        return value
+    idx = int(match.lastgroup[len("_p"):])
+    return _name_patterns[idx].sub(_name_replacements[idx], value)
     
-def get_name_mapper(naming_standard="libaarhusxyz", extra_mappings=None):
+def _build_name_mapping(naming_standard="libaarhusxyz", extra_mappings=None):
+    """Returns a dictionary of lower case source name to name in
+    naming_standard, with extra_mappings taking precedence."""
     mapper = name_mapping.assign(
         **{"dst_name": name_mapping[naming_standard]})
     mapper = mapper.melt(
@@ -75,22 +98,100 @@ def get_name_mapper(naming_standard="libaarhusxyz", extra_mappings=None):
         mapper = pd.concat([mapper, extra_mapper])
         mapper = mapper[~mapper.index.duplicated(keep='last')]
 
+    return mapper.to_dict()
+
+def _extra_mappings_key(extra_mappings):
+    if extra_mappings is None:
+        return None
+    if isinstance(extra_mappings, str):
+        # A CSV file, which may change between calls
+        stat = os.stat(extra_mappings)
+        return ("file", os.path.abspath(extra_mappings), stat.st_size, stat.st_mtime_ns)
+    if isinstance(extra_mappings, dict):
+        # Values may be unhashable (e.g. lists)
+        return ("dict", json.dumps(extra_mappings, sort_keys=True, default=repr))
+    return ("frame", tuple(extra_mappings.columns),
+            tuple(map(tuple, extra_mappings.astype(str).values)))
+
+_name_mappers = {}
+
+def get_name_mapper(naming_standard="libaarhusxyz", extra_mappings=None):
+    """Returns a function mapping a column name to its name in
+    naming_standard. Mappers are cached by naming_standard and the
+    content of extra_mappings, and cache the names they map."""
+    key = (naming_standard, _extra_mappings_key(extra_mappings))
+    if key in _name_mappers:
+        return _name_mappers[key]
+
+    mapping = _build_name_mapping(naming_standard, extra_mappings)
+    names = {}
     def mapperfn(name):
-        newname = map_name_pattern(name)
-        lnewname = newname.lower()
-        if lnewname in mapper.index:
-            newname = mapper.loc[lnewname]
-        return newname
+        if name not in names:
+            newname = map_name_pattern(name)
+            names[name] = mapping.get(newname.lower(), newname)
+        return names[name]
+    _name_mappers[key] = mapperfn
     return mapperfn
 
 default_name_mapper = get_name_mapper()
 
-def project(innproj, utproj, xinn, yinn):
-    innproj = int(innproj)
-    utproj = int(utproj)
-    # UTM convention is coordinate order Northing-Easting. CCh, 2020-06-18
-    return pyproj.Transformer.from_crs(
-        innproj, utproj, always_xy=True).transform(xinn, yinn)
+# Transformers are not thread safe, so each thread has its own cache
+_transformers = threading.local()
+
+PROJECT_CHUNKSIZE = 250000
+
+def get_transformer(innproj, utproj):
+    """Returns a (cached) pyproj Transformer between two EPSG codes."""
+    if not hasattr(_transformers, "cache"):
+        _transformers.cache = {}
+    key = (int(innproj), int(utproj))
+    if key not in _transformers.cache:
+        # UTM convention is coordinate order Northing-Easting. CCh, 2020-06-18
+        _transformers.cache[key] = pyproj.Transformer.from_crs(key[0], key[1], always_xy=True)
+    return _transformers.cache[key]
+
+# The threads of project_many() are kept between calls, so that their
+# cached transformers are reused
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor(workers):
+    """Returns the shared thread pool of project_many(), replacing it if
+    it has another number of workers or was created before a fork."""
+    global _executor
+    key = (workers, os.getpid())
+    with _executor_lock:
+        if _executor is None or _executor[0] != key:
+            if _executor is not None and _executor[0][1] == key[1]:
+                _executor[1].shutdown(wait=False)
+            _executor = (key, concurrent.futures.ThreadPoolExecutor(workers))
+        return _executor[1]
+
+def _project_chunk(innproj, utproj, xinn, yinn, xout, yout, start, end):
+    xout[start:end], yout[start:end] = get_transformer(innproj, utproj).transform(
+        xinn[start:end], yinn[start:end])
+
+def project_many(innproj, utprojs, xinn, yinn, workers=None, chunksize=PROJECT_CHUNKSIZE):
+    """Reprojects xinn, yinn from innproj to each of utprojs, and
+    returns a list of (x, y) arrays, one per utproj. Arrays longer than
+    chunksize are transformed in chunks on a pool of workers threads
+    (default one per CPU), which is kept for later calls."""
+    if len(xinn) <= chunksize:
+        return [get_transformer(innproj, utproj).transform(xinn, yinn) for utproj in utprojs]
+    xinn = np.asarray(xinn, dtype=float)
+    yinn = np.asarray(yinn, dtype=float)
+    res = [(np.empty(len(xinn)), np.empty(len(xinn))) for utproj in utprojs]
+    executor = _get_executor(workers or os.cpu_count())
+    futures = [executor.submit(_project_chunk, innproj, utproj, xinn, yinn, xout, yout,
+                               start, start + chunksize)
+               for utproj, (xout, yout) in zip(utprojs, res)
+               for start in range(0, len(xinn), chunksize)]
+    for future in futures:
+        future.result()
+    return res
+
+def project(innproj, utproj, xinn, yinn, workers=None):
+    return project_many(innproj, [utproj], xinn, yinn, workers)[0]
 
 def normalize_headers(model, naming_standard="libaarhusxyz", extra_mappings=None):
     headers = model.model_info
@@ -168,9 +269,9 @@ def normalize_coordinates(model, project_crs=None):
          df["x_orig"] = df[srcxcol]
          df["y_orig"] = df[srcycol]
     
-    df[xcol], df[ycol] = project(headers["projection"], project_crs, srcx, srcy)
-    df["x_web"], df["y_web"] = project(headers["projection"], 3857, srcx, srcy)
-    df["lon"], df["lat"] = project(headers["projection"], 4326, srcx, srcy)
+    ((df[xcol], df[ycol]),
+     (df["x_web"], df["y_web"]),
+     (df["lon"], df["lat"])) = project_many(headers["projection"], [project_crs, 3857, 4326], srcx, srcy)
 
     headers["projection"] = project_crs
     
@@ -274,43 +375,77 @@ def calculate_doi_layer(model):
                               1, 0)), columns=layer_dfs["dep_bot"].columns)
 
 
-def _fix_hour_24(datetimestr):
-    """Fix times with hour 24 (e.g., '24:00' or '24:00.5') by converting to 00:xx of the next day.
-
-    Some data sources use 24:00 to represent midnight at the end of a day.
-    This is technically valid per ISO 8601 but pandas doesn't support it.
+# Times to_timedelta() reads the same as to_datetime(), unlike e.g. 09:53:52 PM or 095352
+_RE_TIME_OF_DAY = re.compile(r"^\d{1,2}:\d{2}(:\d{2}(\.\d+)?)?$")
+_RE_HOUR_24 = re.compile(r"\b24:(\d{2}(?:[.:]\d+)?)\b")
+
+def _is_time_of_day(timestr):
+    return all(_RE_TIME_OF_DAY.match(value) for value in timestr)
+
+def _parse_times(timestr, time_format=None):
+    """Parses an array of time of day strings into Timedeltas,
+    reading hour 24 as 00 of the next day and empty strings as 0."""
+    empty = timestr == ""
+    if empty.any():
+        res = np.zeros(len(timestr), dtype="timedelta64[ns]")
+        res[~empty] = _parse_times(timestr[~empty], time_format).values
+        return pd.TimedeltaIndex(res)
+    timestr = pd.Index(timestr).str.strip()
+    if time_format is None and _is_time_of_day(timestr):
+        try:
+            # Reads hours >= 24 as is
+            return pd.to_timedelta(timestr)
+        except ValueError:
+            pass
+    hour24 = timestr.str.startswith("24:")
+    times = pd.to_datetime(timestr.where(~hour24, "00:" + timestr.str[3:]), format=time_format)
+    return (times - times.normalize()) + pd.to_timedelta(hour24.astype(int), unit="D")
+
+def _parse_joined_datetimes(datestr, timestr):
+    """Parses each distinct date and time pair joined into one string,
+    for times that can only be read together with their date (e.g.
+    095352)."""
+    joined = np.where(datestr != "", datestr + " " + timestr, "")
+    codes, values = pd.factorize(joined, use_na_sentinel=False)
+    values = pd.Series(values, dtype=object)
+    hour24 = values.str.contains(_RE_HOUR_24)
+    values = values.str.replace(_RE_HOUR_24, lambda match: "00:" + match.group(1), regex=True)
+    parsed = pd.to_datetime(values.replace("", None)) + pd.to_timedelta(hour24.astype(int), unit="D")
+    return pd.Series(parsed.values[codes])
+
+def parse_datetimes(datestr, timestr, date_format=None, time_format=None):
+    """Parses arrays of date and time of day strings into datetimes.
+
+    Flights have few distinct dates, so each distinct date (and time)
+    string is only parsed once. Hours of 24 (e.g. '24:00:00.5') are
+    read as 00 of the next day. Rows with an empty date are NaT, and
+    an empty time is midnight.
+
+    date_format, time_format: optional strptime formats, inferred by
+    pandas by default. Without formats, times other than HH:MM[:SS[.f]]
+    (e.g. 09:53:52 PM) are parsed together with their dates, once per
+    distinct pair.
     """
-    result = []
-    for dt in datetimestr:
-        if not dt or not isinstance(dt, str):
-            result.append(dt)
-            continue
-        # Match patterns like "24:00", "24:00.5", "24:00:00"
-        match = re.search(r'\b24:(\d{2}(?:[.:]\d+)?)\b', dt)
-        if match:
-            # Parse the date part and add one day
-            time_part = '00:' + match.group(1)
-            date_part = dt[:match.start()].strip()
-            try:
-                parsed_date = pd.to_datetime(date_part) + pd.Timedelta(days=1)
-                dt = parsed_date.strftime('%Y-%m-%d') + ' ' + time_part
-            except:
-                pass  # If parsing fails, leave as-is and let pandas raise the error
-        result.append(dt)
-    return np.array(result)
-
-
-def normalize_dates(model):
+    datestr = np.asarray(datestr, dtype=object)
+    timestr = np.asarray(timestr, dtype=object)
+    datecodes, dates = pd.factorize(datestr, use_na_sentinel=False)
+    timecodes, times = pd.factorize(timestr, use_na_sentinel=False)
+    if date_format is None and time_format is None and not _is_time_of_day(
+            time.strip() for time in times if time != ""):
+        return _parse_joined_datetimes(datestr, timestr)
+    dates = pd.to_datetime(pd.Series(dates).replace("", None), format=date_format).values
+    times = _parse_times(times, time_format).values
+    return pd.Series(dates[datecodes] + times[timecodes])
+
+def normalize_dates(model, date_format=None, time_format=None):
     datecol = model.get_column("date")
     timecol = model.get_column("time")
     if datecol is not None and timecol is not None and datecol in model.flightlines.columns and timecol in model.flightlines.columns:
-        datestr = model.flightlines[datecol].fillna("").astype(str)
-        timestr = model.flightlines[timecol].fillna("").astype(str)
-        datetimestr = np.where(datestr != "", datestr + " " + timestr, "")
-        # Fix hour 24 timestamps (e.g., "24:00" -> "00:00" next day)
-        datetimestr = _fix_hour_24(datetimestr)
+        datestr = model.flightlines[datecol].fillna("").astype(str).values
+        timestr = model.flightlines[timecol].fillna("").astype(str).values
         timestampcol = model.get_column("timestamp")
-        model.flightlines[timestampcol] = pd.Series(pd.to_datetime(datetimestr) - datetime.datetime(1900,1,1)).dt.total_seconds() / (24 * 60 * 60)
+        model.flightlines[timestampcol] = (parse_datetimes(datestr, timestr, date_format, time_format)
+                                           - datetime.datetime(1900,1,1)).dt.total_seconds().values / (24 * 60 * 60)
 
 
 def normalize_sort_datetime(model):
@@ -327,26 +462,50 @@ def normalize_sort_datetime(model):
         model.flightlines.sort_values(by=timestampcol, inplace=True)
         indexer = model.flightlines.index
         model.flightlines.reset_index(drop=True, inplace=True)
+        if isinstance(model.layer_data, layerdata.LayerData):
+            model.layer_data = model.layer_data.reindex(indexer).reset_index(drop=True)
+            return
         for key in model.layer_data.keys():
             model.layer_data[key] = model.layer_data[key].reindex(index=indexer)
             model.layer_data[key].reset_index(drop=True, inplace=True)
 
+def _nan_value_mask(values, nan_value):
+    """Returns a boolean array of where values equal nan_value, or
+    None if they can not (e.g. a text nan_value and numeric values)."""
+    if not isinstance(values, np.ndarray):
+        try:
+            return np.asarray(pd.Series(values) == nan_value, dtype=bool)
+        except TypeError:
+            return None
+    if values.dtype.kind in "biuf":
+        try:
+            nan_value = float(nan_value)
+        except (TypeError, ValueError):
+            return None
+    elif values.dtype != object:
+        return None
+    return values == nan_value
+
 def normalize_nans(model, nan_value=None):
     if nan_value is None:
+        if model.model_dict.get("file_meta", {}).get("nan_dummy"):
+            # The dummy value (and *) was already read as NaN by the parser
+            return
         if 'dummy' in model.model_info.keys():
             nan_value = model.model_info['dummy']
         else:
             nan_value='*'
-        
+
+    # One comparison per column / layer_data group, and only a copy for those with any nan_value in them
     for col in model.flightlines.columns:
-        filt=model.flightlines[col]==nan_value
-        if filt.sum() > 0:
-            model.flightlines.loc[filt,col]=np.nan
+        mask = _nan_value_mask(model.flightlines[col].values, nan_value)
+        if mask is not None and mask.any():
+            model.flightlines[col] = model.flightlines[col].mask(mask)
     
-    for key in model.layer_data.keys():
-        filt=model.layer_data[key]==nan_value
-        if filt.values.sum() > 0:
-            model.layer_data[key][filt]=np.nan
+    for key, df in model.layer_data.items():
+        mask = _nan_value_mask(df.to_numpy(), nan_value)
+        if mask is not None and mask.any():
+            model.layer_data[key] = df.mask(mask)
 
     # FIXME: Convert column types from O here?
         
@@ -355,7 +514,148 @@ def normalize_naming(model, naming_standard="libaarhusxyz", extra_mappings=None)
     normalize_column_names(model, naming_standard, extra_mappings=extra_mappings)
     model.model_info["naming_standard"] = naming_standard
         
-def normalize(model, project_crs=None, required_columns=None, naming_standard="libaarhusxyz", nan_value=None, extra_mappings=None):
+class _Version(object):
+    """Identity of the data of a column or layer_data group, which
+    changes when it is assigned or replaced, but not when its values
+    are edited in place. Only holds a weak reference to the data."""
+    def __init__(self, obj, key):
+        self.ref = weakref.ref(obj)
+        self.key = key
+
+    def __eq__(self, other):
+        return (isinstance(other, _Version) and self.key == other.key
+                and self.ref() is not None and self.ref() is other.ref())
+
+def _column_version(series):
+    if not isinstance(series.dtype, np.dtype):
+        values = series.array
+        return _Version(values, (len(values), str(series.dtype)))
+    values = series.to_numpy()
+    base = values
+    while isinstance(base.base, np.ndarray):
+        base = base.base
+    return _Version(base, (values.__array_interface__["data"][0], values.shape, values.strides, values.dtype.str))
+
+def _fingerprint(model, inputs):
+    """The state of the inputs of a normalization step: a list of
+    ("flightlines", column), ("layer_data", key), ("model_info", key),
+    ("names", None), ("rows", None) or ("exists", column or layer_data
+    key). Data is compared by identity, not by value, so that checking
+    is cheap whatever the size of the model."""
+    res = []
+    for kind, name in inputs:
+        if kind == "flightlines":
+            if name is not None and name in model.flightlines.columns:
+                res.append((kind, name, _column_version(model.flightlines[name])))
+        elif kind == "layer_data":
+            if name in model.layer_data:
+                df = model.layer_data[name]
+                res.append((kind, name, _Version(df, (df.shape, tuple(df.columns)))))
+        elif kind == "model_info":
+            res.append((kind, name, repr(model.model_info.get(name))))
+        elif kind == "names":
+            res.append((kind, name, (tuple(model.flightlines.columns), tuple(model.layer_data.keys()))))
+        elif kind == "rows":
+            res.append((kind, name, len(model.flightlines)))
+        elif kind == "exists":
+            res.append((kind, name, name in model.flightlines.columns or name in model.layer_data))
+    return res
+
+def _columns(*names):
+    return [("flightlines", name) for name in names]
+
+def _layers(*keys):
+    return [("layer_data", key) for key in keys]
+
+# The steps of normalize(), in the order they are run: name, function,
+# steps it depends on, its inputs (see _fingerprint()) and the columns /
+# layer_data groups it calculates. A step is only run again when its
+# inputs, or the options, have changed since it last ran, or when one
+# of its outputs has been removed.
+NORMALIZE_STEPS = [
+    ("naming",
+     lambda model, options: normalize_naming(model, options["naming_standard"],
+                                             extra_mappings=options["extra_mappings"]),
+     (),
+     lambda model, options: [("names", None), ("model_info", "naming_standard")],
+     ()),
+    ("nans",
+     lambda model, options: normalize_nans(model, options["nan_value"]),
+     ("naming",),
+     # Structural only, as edits of values are not tracked
+     lambda model, options: [("names", None), ("rows", None)],
+     ()),
+    ("projection",
+     lambda model, options: normalize_projection(model),
+     ("naming",),
+     lambda model, options: [("model_info", "projection"), ("model_info", "coordinate system")],
+     ()),
+    ("coordinates",
+     lambda model, options: normalize_coordinates(model, options["project_crs"]),
+     ("nans", "projection"),
+     lambda model, options: (_columns(*[model.get_column(name) for name in ("x", "y", "lat", "lon")])
+                             + [("model_info", "projection")]),
+     ("x_orig", "y_orig", "x_web", "y_web", "lon", "lat")),
+    ("dates",
+     lambda model, options: normalize_dates(model),
+     ("nans",),
+     lambda model, options: _columns(*[model.get_column(name) for name in ("date", "time")]),
+     ("timestamp",)),
+    ("sort",
+     lambda model, options: normalize_sort_datetime(model),
+     ("dates",),
+     lambda model, options: _columns(model.get_column("timestamp")) + [("rows", None)],
+     ()),
+    ("xdist",
+     lambda model, options: calculate_xdist(model),
+     ("coordinates", "sort"),
+     lambda model, options: _columns(*[model.get_column(name) for name in ("x", "y", "title")]),
+     ("xdist",)),
+    ("defaults",
+     lambda model, options: add_defaults(model, options["required_columns"]),
+     ("nans",),
+     lambda model, options: [("names", None), ("rows", None)],
+     ("doi_lower", "doi_upper", "resistivity_variance_factor")),
+    ("depths",
+     lambda model, options: normalize_depths(model),
+     ("defaults",),
+     lambda model, options: _layers("dep_bot", "dep_top", "height"),
+     ("dep_bot", "dep_top")),
+    ("z",
+     lambda model, options: calculate_z(model),
+     ("depths", "sort"),
+     lambda model, options: _layers("dep_bot", "dep_top") + _columns(model.z_column),
+     ("z_bottom", "z_top")),
+    ("height",
+     lambda model, options: calculate_height(model),
+     ("depths",),
+     lambda model, options: _layers("dep_bot", "dep_top", "height"),
+     ("height",)),
+    ("doi_layer",
+     lambda model, options: calculate_doi_layer(model),
+     ("depths", "defaults"),
+     lambda model, options: _layers("dep_bot") + _columns("doi_lower", "doi_upper"),
+     ("doi_layer",)),
+]
+
+NORMALIZE_OUTPUTS = {output: name for name, run, deps, inputs, outputs in NORMALIZE_STEPS for output in outputs}
+
+def _step_inputs(model, options, inputs, outputs):
+    return inputs(model, options) + [("exists", output) for output in outputs]
+
+def _needed_steps(names):
+    deps = {name: step_deps for name, run, step_deps, inputs, outputs in NORMALIZE_STEPS}
+    needed = set()
+    todo = list(names)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(deps[name])
+    return [step for step in NORMALIZE_STEPS if step[0] in needed]
+
+def normalize(model, project_crs=None, required_columns=None, naming_standard="libaarhusxyz", nan_value=None, extra_mappings=None,
+              outputs=None, lazy=False, force=False):
     """This function
          * Normalizes naming and format to our internal format
          * Replaces * with NaN:s
@@ -364,6 +664,14 @@ def normalize(model, project_crs=None, required_columns=None, naming_standard="l
          * Calculate z coordinates
          * Add missing columns (filled with NaNs)
 
+    The steps (see NORMALIZE_STEPS) remember the state of their
+    inputs, and are skipped when normalizing again, unless their inputs
+    (or the arguments) have changed since, or one of their outputs has
+    been removed. Columns and layer_data groups count as changed when
+    they are assigned (e.g. xyz.flightlines["x"] = x), not when their
+    values are edited in place (e.g. with .loc); use force=True after
+    such edits.
+
     Parameters
     ----------
     extra_mappings : dict, str, or DataFrame, optional
@@ -372,21 +680,74 @@ def normalize(model, project_crs=None, required_columns=None, naming_standard="l
         - str: path to a CSV file with columns 'libaarhusxyz' and 'input'
         - DataFrame: with columns 'libaarhusxyz' and 'input'
         Custom mappings take precedence over default mappings.
+    outputs : list, optional
+        Only run the steps needed to calculate these columns /
+        layer_data groups (see NORMALIZE_OUTPUTS), e.g. ["xdist"].
+    lazy : bool, optional
+        Only normalize naming, and calculate the rest when first
+        accessed through ensure() (or XYZ attributes, e.g. xyz.z_top).
+    force : bool, optional
+        Run all (needed) steps, whether their inputs have changed or not.
     """
-
-    normalize_naming(model, naming_standard, extra_mappings=extra_mappings)
-
-    normalize_nans(model, nan_value)
-    normalize_projection(model)
-    normalize_coordinates(model, project_crs)
-    normalize_dates(model)
-    normalize_sort_datetime(model)
-
-    calculate_xdist(model)
-    add_defaults(model, required_columns)
-    normalize_depths(model)
-    calculate_z(model)
-    calculate_height(model)
-    calculate_doi_layer(model)
+    options = {"project_crs": project_crs, "required_columns": required_columns,
+               "naming_standard": naming_standard, "nan_value": nan_value,
+               "extra_mappings": extra_mappings}
+    state = model._normalization
+    if state is None or _options_key(state["options"]) != _options_key(options):
+        state = model._normalization = {"options": options, "fingerprints": {}, "last_run": []}
+
+    if lazy:
+        names = ["naming"]
+    elif outputs is None:
+        names = [name for name, run, deps, inputs, step_outputs in NORMALIZE_STEPS]
+        if isinstance(model.layer_data, layerdata.LazyLayerData):
+            # Read all groups in one pass rather than one by one
+            model.layer_data.load()
+    else:
+        unknown = [output for output in outputs if output not in NORMALIZE_OUTPUTS]
+        if unknown:
+            raise ValueError("Unknown outputs: %s" % ", ".join(unknown))
+        names = [NORMALIZE_OUTPUTS[output] for output in outputs]
+    steps = _needed_steps(names)
+
+    fingerprints = state["fingerprints"]
+    state["last_run"] = []
+    with profiling.stage("normalize") as info:
+        for name, run, deps, inputs, step_outputs in steps:
+            if not force and name in fingerprints and fingerprints[name] == _fingerprint(
+                    model, _step_inputs(model, options, inputs, step_outputs)):
+                continue
+            with profiling.stage("normalize." + name) as step_info:
+                run(model, options)
+                step_info["rows"] = len(model.flightlines)
+            state["last_run"].append(name)
+        # Steps can change the inputs of earlier ones (e.g. sorting), so record them once all are done
+        if state["last_run"]:
+            for name, run, deps, inputs, step_outputs in steps:
+                fingerprints[name] = _fingerprint(model, _step_inputs(model, options, inputs, step_outputs))
+        info["rows"] = len(model.flightlines)
     
     return model
+
+def _refresh_fingerprints(model):
+    """Records the current state of the inputs of the steps that have
+    run, after their data has been moved without being changed (e.g.
+    into LayerData blocks)."""
+    state = model._normalization
+    if state is None:
+        return
+    for name, run, deps, inputs, step_outputs in NORMALIZE_STEPS:
+        if name in state["fingerprints"]:
+            state["fingerprints"][name] = _fingerprint(
+                model, _step_inputs(model, state["options"], inputs, step_outputs))
+
+def _options_key(options):
+    return repr(dict(options, extra_mappings=_extra_mappings_key(options["extra_mappings"])))
+
+def ensure(model, *outputs):
+    """Calculates the columns / layer_data groups outputs (see
+    NORMALIZE_OUTPUTS), with the arguments of the last normalize() of
+    model, or the defaults, only running the steps that are needed and
+    not up to date."""
+    options = model._normalization["options"] if model._normalization is not None else {}
+    normalize(model, outputs=list(outputs), **options)
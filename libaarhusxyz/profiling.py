@@ -0,0 +1,128 @@
+"""Opt-in profiling of parsing, normalization and export.
+
+    with libaarhusxyz.profiling.profile() as report:
+        xyz = libaarhusxyz.XYZ("model.xyz", normalize=True)
+        xyz.to_npy("store")
+    print(report)
+
+Each stage records its wall time, CPU time (of this process), the
+number of rows processed and the peak memory allocated above what was
+allocated when it started, measured with tracemalloc. Stages nest:
+"parse" contains "parse.header", "parse.tokenize", "parse.convert"
+and "parse.split" (whichever engine is used), "normalize" contains one "normalize.<step>" per
+step that is run (see normalizer.NORMALIZE_STEPS), and each exporter
+records an "export.<format>" stage. Work done in worker processes
+(parse(..., workers=N), parse_many()) is only accounted for by the
+stage waiting for it.
+
+When no profile is active, stage() does nothing.
+"""
+
+import contextlib
+import time
+import tracemalloc
+import pandas as pd
+
+FIELDS = ["stage", "depth", "wall", "cpu", "rows", "peak_memory"]
+
+_active = []
+_open = []
+
+class Report(object):
+    """The stages recorded by profile(), as a list of dictionaries
+    with the keys FIELDS, in the order they finished (nested stages
+    before the stage containing them)."""
+    def __init__(self):
+        self.stages = []
+
+    def __iter__(self):
+        return iter(self.stages)
+
+    def __len__(self):
+        return len(self.stages)
+
+    def to_frame(self):
+        """Returns the stages as a DataFrame with the columns FIELDS."""
+        return pd.DataFrame(self.stages, columns=FIELDS)
+
+    def totals(self):
+        """Returns a DataFrame indexed by stage name, summing wall time,
+        CPU time and rows, and with the largest peak memory of each
+        stage."""
+        return self.to_frame().groupby("stage", sort=False).agg(
+            {"wall": "sum", "cpu": "sum", "rows": "sum", "peak_memory": "max"})
+
+    def __str__(self):
+        frame = self.to_frame()
+        frame["stage"] = ["  " * depth + name for name, depth in zip(frame["stage"], frame["depth"])]
+        width = max([len("stage")] + [len(name) for name in frame["stage"]])
+        return frame.drop(columns="depth").to_string(
+            index=False, justify="left", formatters={"stage": lambda name: name.ljust(width)})
+
+@contextlib.contextmanager
+def profile(memory=True, callback=None):
+    """Records the stages run in the with block into the Report it
+    returns.
+
+    memory: measure peak memory with tracemalloc, which is started for
+    the duration of the block if not already running (this slows down
+    allocation heavy code). If False, peak_memory is None unless
+    tracemalloc is running anyway.
+
+    callback: optional function called with the dictionary of each
+    stage as it finishes.
+    """
+    report = Report()
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    entry = (report, callback)
+    _active.append(entry)
+    try:
+        yield report
+    finally:
+        _active.remove(entry)
+        if started:
+            tracemalloc.stop()
+
+@contextlib.contextmanager
+def stage(name, rows=None):
+    """Records the with block as the stage name in the active profiles.
+    Returns a dictionary in which the block can set "rows" if it is not
+    known up front."""
+    if not _active:
+        yield {"rows": rows}
+        return
+    info = {"rows": rows}
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        # Resetting the peak for this stage would hide it from the stages containing it
+        for parent in _open:
+            if parent["peak"] is not None:
+                parent["peak"] = max(parent["peak"], peak)
+        tracemalloc.reset_peak()
+        frame = {"start": current, "peak": current}
+    else:
+        frame = {"start": None, "peak": None}
+    _open.append(frame)
+    depth = len(_open) - 1
+    wall, cpu = time.perf_counter(), time.process_time()
+    try:
+        yield info
+    finally:
+        wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+        _open.remove(frame)
+        peak_memory = None
+        if tracing and tracemalloc.is_tracing():
+            frame["peak"] = max(frame["peak"], tracemalloc.get_traced_memory()[1])
+            for parent in _open:
+                if parent["peak"] is not None:
+                    parent["peak"] = max(parent["peak"], frame["peak"])
+            peak_memory = frame["peak"] - frame["start"]
+        record = {"stage": name, "depth": depth, "wall": wall, "cpu": cpu,
+                  "rows": info["rows"], "peak_memory": peak_memory}
+        for report, callback in list(_active):
+            report.stages.append(record)
+            if callback is not None:
+                callback(record)
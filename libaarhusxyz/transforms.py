@@ -2,39 +2,220 @@ import pandas as pd
 import numpy as np
 
 
+def _source_layers(dep_top, dep_bot):
+    """Returns the boundaries of the union layers (tops and bottoms)
+    and, for each sounding and union layer, the position of the layer
+    of the sounding that contains it, or the number of layers if there
+    is none."""
+    bots = np.where(np.isnan(dep_bot), np.inf, dep_bot)
+    tops = np.where(np.isnan(dep_top), np.inf, dep_top)
+    unique_bots = np.unique(bots)
+    union_tops = np.concatenate([[0], unique_bots[:-1]])
+
+    # Work on each distinct layer grid once rather than on each sounding
+    nlayers = bots.shape[1]
+    grids, grid_idx = np.unique(np.concatenate([tops, bots], axis=1), axis=0, return_inverse=True)
+    grid_tops, grid_bots = grids[:, :nlayers], grids[:, nlayers:]
+
+    # The source layer is the first one with a bottom at or below the union layer bottom, i.e.
+    # the number of layers of the grid with a bottom above it (bottoms increase with depth).
+    positions = np.searchsorted(unique_bots, grid_bots) + 1
+    positions += np.arange(len(grids))[:, None] * (len(unique_bots) + 1)
+    counts = np.bincount(positions.ravel(), minlength=len(grids) * (len(unique_bots) + 1))
+    grid_sources = counts.reshape(len(grids), len(unique_bots) + 1).cumsum(axis=1)[:, :len(unique_bots)]
+
+    src_tops = np.take_along_axis(grid_tops, np.minimum(grid_sources, nlayers - 1), axis=1)
+    grid_sources[(grid_sources >= nlayers) | ~(src_tops <= union_tops)] = nlayers
+    return union_tops, unique_bots, grid_sources[grid_idx.reshape(-1)]
+
 def normalize_layer_depths(data):
     """Normalizes all layer depths, so that layer X is at the same depth
     in all soundings. This is done by upsampling all soundings to a
     set of layers with boundaries (top and bottom) being the union of
     all boundaries from all the soundings. Note that this is just pure
     upsampling, not interpolation.
+
+    Missing (NaN) boundaries are read as infinitely deep, as in
+    normalizer.normalize_depths(). Parameters are returned as float
+    arrays (object arrays if they can not be converted), and
+    are NaN where a sounding has no layer covering a union layer, or
+    the parameter lacks the sounding's layer.
+    """
+    layer_data = data["layer_data"]
+    labels = layer_data["dep_top"].columns
+    union_tops, union_bots, sources = _source_layers(
+        layer_data["dep_top"].to_numpy(dtype=float), layer_data["dep_bot"].to_numpy(dtype=float))
+    nrows, nlayers = sources.shape[0], len(labels)
+    columns = np.arange(len(union_bots))
+    # Positions in the flattened (soundings x layers + 1) parameter arrays, the extra layer being missing
+    positions = (sources + np.arange(nrows)[:, None] * (nlayers + 1)).ravel()
+
+    res_layer_data = {}
+    for param, df in layer_data.items():
+        if param in ("dep_top", "dep_bot"):
+            continue
+        values = df.reindex(columns=labels).to_numpy()
+        try:
+            values = values.astype(float)
+        except (TypeError, ValueError):
+            values = values.astype(object)
+        padded = np.full((nrows, nlayers + 1), np.nan, dtype=values.dtype)
+        padded[:, :nlayers] = values
+        res_layer_data[param] = pd.DataFrame(padded.ravel().take(positions).reshape(sources.shape),
+                                             index=df.index, columns=columns)
+    res_layer_data["dep_top"] = pd.DataFrame(np.broadcast_to(union_tops, sources.shape).copy(),
+                                             index=layer_data["dep_top"].index, columns=columns)
+    res_layer_data["dep_bot"] = pd.DataFrame(np.broadcast_to(union_bots, sources.shape).copy(),
+                                             index=layer_data["dep_bot"].index, columns=columns)
+    res_layer_data = {param: res_layer_data[param] for param in layer_data.keys()}
+
+    data = dict(data)
+    data["layer_data"] = res_layer_data
+    return data
+
+RESAMPLE_METHODS = ("nearest", "thickness", "log")
+
+def _layer_positions(bots, depths):
+    """For each sounding (row) and depth, the position of the first
+    layer with a bottom at or below it, or the number of layers if
+    there is none. Rows of bots must be increasing."""
+    nrows, nlayers = bots.shape
+    finite = np.concatenate([bots.ravel(), depths.ravel(), [0]])
+    finite = finite[np.isfinite(finite)]
+    low, high = finite.min(), finite.max() + 1
+    # Shift each row by a multiple of the depth range, so that one searchsorted handles all rows
+    offsets = np.arange(nrows)[:, None] * (high - low + 1)
+    keys = (np.minimum(bots, high) - low + offsets).ravel()
+    positions = np.searchsorted(keys, (depths - low + offsets).ravel(), side="left")
+    return positions.reshape(depths.shape) - np.arange(nrows)[:, None] * nlayers
+
+def _integrals(values, thickness, flat_positions, inside):
+    """Integrals of the (NaN free) layer values from the surface down
+    to the depths with the layer positions flat_positions (in the
+    flattened values) and inside those layers."""
+    with np.errstate(invalid="ignore"):
+        contrib = np.where(values != 0, values * thickness, 0)
+    # The last layer may be infinitely thick, but no layer is below it
+    prefix = np.concatenate([np.zeros((len(values), 1)), np.cumsum(contrib[:, :-1], axis=1)], axis=1)
+    return prefix.ravel().take(flat_positions) + values.ravel().take(flat_positions) * inside
+
+def resample_layers(data, boundaries, method="nearest", elevation=None):
+    """Resamples all layer_data parameters onto a grid of cells, so
+    that each parameter becomes one dense (soundings x cells) float
+    DataFrame.
+
+    boundaries: the ncells + 1 cell boundaries, either increasing
+    depths, e.g. numpy.arange(0, 300, 5), or, if elevation is given,
+    decreasing elevations, e.g. numpy.arange(100, -200, -5).
+
+    method: how to calculate the value of a cell from the layers it
+    overlaps, either for all parameters or as a dictionary from
+    layer_data keys to methods (keys not listed use "nearest"):
+      - "nearest": the layer containing the middle of the cell
+      - "thickness": the mean of the layers, weighted by how much of
+        the cell each one covers
+      - "log": as "thickness", but averaging log10 of the values
+        (i.e. a weighted geometric mean, as for resistivity)
+    Layers with NaN values are left out of the averages, and cells not
+    covered by any layer (e.g. above the surface or below the deepest
+    finite layer bottom) are NaN.
+
+    elevation: surface elevation of each sounding, as an array or the
+    name of a flightlines column, to resample in absolute elevation
+    instead of depth.
+
+    dep_top, dep_bot and (if present) height are replaced by the cell
+    boundaries and thicknesses of each sounding, in depth. z_top and
+    z_bottom are replaced by the cell elevations if elevation is given,
+    and otherwise left out. Missing (NaN) layer boundaries are read as
+    infinitely deep, as in normalizer.normalize_depths().
     """
-    d_bot = data["layer_data"]["dep_bot"]
-    groups = data["layer_data"]["dep_top"].groupby(by=list(data["layer_data"]["dep_top"].columns)).groups
-
-    unique_depths = np.unique(d_bot.values.flatten())
-    u_d = pd.DataFrame({"unique": pd.Series(unique_depths)})
-
-    res_layer_data = {param: pd.DataFrame(index=data["layer_data"][param].index,
-                                          columns=np.arange(len(u_d.unique)))
-                      for param in data["layer_data"].keys()}
-
-    for g1 in groups.values():
-        g1_boundaries = pd.DataFrame({"top": data["layer_data"]["dep_top"].loc[g1].iloc[0],
-                                      "bot": data["layer_data"]["dep_bot"].loc[g1].iloc[0]}).fillna(np.inf)
-        for dest_layer, (top, bot) in enumerate(zip([0] + list(u_d.unique), list(u_d.unique))):
-            source_layer = g1_boundaries.index[(g1_boundaries.top <= top) & (g1_boundaries.bot >= bot)][0]
-            
-            for param in res_layer_data.keys():
-                if param in ("dep_top", "dep_bot"):
-                    continue
-                if source_layer not in data["layer_data"][param].columns:
-                    param_data = np.nan
-                else:
-                    param_data = data["layer_data"][param].loc[g1, source_layer]
-                res_layer_data[param].loc[g1, dest_layer] = param_data
-            res_layer_data["dep_top"].loc[g1, dest_layer] = top
-            res_layer_data["dep_bot"].loc[g1, dest_layer] = bot
+    layer_data = data["layer_data"]
+    methods = method if isinstance(method, dict) else {key: method for key in layer_data.keys()}
+    unknown = [name for name in methods.values() if name not in RESAMPLE_METHODS]
+    if unknown:
+        raise ValueError("Unknown resampling method %s, use one of %s" % (unknown[0], ", ".join(RESAMPLE_METHODS)))
+    boundaries = np.asarray(boundaries, dtype=float)
+    if boundaries.ndim != 1 or len(boundaries) < 2:
+        raise ValueError("boundaries must be a sequence of at least two cell boundaries")
+
+    labels = layer_data["dep_top"].columns
+    index = layer_data["dep_top"].index
+    tops = layer_data["dep_top"].to_numpy(dtype=float)
+    tops = np.where(np.isnan(tops), np.inf, tops)
+    bots = layer_data["dep_bot"].to_numpy(dtype=float)
+    bots = np.where(np.isnan(bots), np.inf, bots)
+    nrows, nlayers = bots.shape
+    if not nlayers:
+        raise ValueError("layer_data has no layers to resample")
+    with np.errstate(invalid="ignore"):
+        if (np.diff(bots, axis=1) < 0).any():
+            raise ValueError("dep_bot must increase with depth in all soundings")
+
+    if elevation is None:
+        if not (np.diff(boundaries) > 0).all():
+            raise ValueError("boundaries must be increasing depths")
+        depths = np.broadcast_to(boundaries, (nrows, len(boundaries)))
+    else:
+        if isinstance(elevation, str):
+            elevation = data["flightlines"][elevation]
+        elevation = np.asarray(elevation, dtype=float)
+        if not (np.diff(boundaries) < 0).all():
+            raise ValueError("boundaries must be decreasing elevations")
+        depths = elevation[:, None] - boundaries[None, :]
+    columns = np.arange(len(boundaries) - 1)
+    rows = np.arange(nrows)[:, None]
+
+    # Layer positions shared by all parameters, for the cell boundaries (clamped to the bottom of
+    # the deepest layer, below which nothing is added) and the middle of the cells
+    clamped = np.minimum(depths, bots[:, -1:])
+    positions = np.minimum(_layer_positions(bots, clamped), nlayers - 1)
+    flat_positions = positions + rows * nlayers
+    thickness = bots - tops
+    with np.errstate(invalid="ignore"):
+        inside = np.clip(clamped - tops.ravel().take(flat_positions), 0, None)
+    coverage = None
+    middles = (depths[:, :-1] + depths[:, 1:]) / 2
+    middle_positions = _layer_positions(bots, middles)
+    middle_tops = tops[rows, np.minimum(middle_positions, nlayers - 1)]
+    middle_positions[(middle_positions >= nlayers) | ~(middle_tops <= middles)] = nlayers
+
+    res_layer_data = {}
+    for key, df in layer_data.items():
+        if key in ("dep_top", "dep_bot", "height", "z_top", "z_bottom"):
+            continue
+        values = df.reindex(columns=labels).to_numpy(dtype=float)
+        method = methods.get(key, "nearest")
+        if method == "nearest":
+            padded = np.concatenate([values, np.full((nrows, 1), np.nan)], axis=1)
+            resampled = padded[rows, middle_positions]
+        else:
+            if method == "log":
+                with np.errstate(divide="ignore", invalid="ignore"):
+                    values = np.log10(values)
+            valid = np.isfinite(values)
+            values = np.where(valid, values, 0)
+            value_sums = np.diff(_integrals(values, thickness, flat_positions, inside), axis=1)
+            if valid.all():
+                # The weights are the lengths of the cells covered by layers, the same for all such parameters
+                if coverage is None:
+                    coverage = np.diff(_integrals(np.ones((nrows, nlayers)), thickness, flat_positions, inside), axis=1)
+                weight_sums = coverage
+            else:
+                weight_sums = np.diff(_integrals(valid.astype(float), thickness, flat_positions, inside), axis=1)
+            with np.errstate(divide="ignore", invalid="ignore"):
+                resampled = np.where(weight_sums > 0, value_sums / weight_sums, np.nan)
+            if method == "log":
+                resampled = 10 ** resampled
+        res_layer_data[key] = pd.DataFrame(resampled, index=df.index, columns=columns)
+
+    res_layer_data["dep_top"] = pd.DataFrame(np.array(depths[:, :-1]), index=index, columns=columns)
+    res_layer_data["dep_bot"] = pd.DataFrame(np.array(depths[:, 1:]), index=index, columns=columns)
+    if "height" in layer_data:
+        res_layer_data["height"] = pd.DataFrame(np.diff(depths, axis=1), index=index, columns=columns)
+    if elevation is not None:
+        res_layer_data["z_top"] = pd.DataFrame(np.tile(boundaries[:-1], (nrows, 1)), index=index, columns=columns)
+        res_layer_data["z_bottom"] = pd.DataFrame(np.tile(boundaries[1:], (nrows, 1)), index=index, columns=columns)
 
     data = dict(data)
     data["layer_data"] = res_layer_data
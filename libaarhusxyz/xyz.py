@@ -11,8 +11,28 @@ import matplotlib.colors
 
 from .xyzparser import dump as _dump_function
 from .xyzparser import parse
+from .xyzparser import parse_many
+from .xyzparser import parse_header
 from . import normalizer
+from . import layerdata
+from . import transforms
 import copy
+import functools
+
+def _parse_layer_groups(nameorfile, layer_groups, **kw):
+    return parse(nameorfile, columns=[], layer_groups=layer_groups, **kw)["layer_data"]
+
+def _load_layer_groups(directory, layer_groups, **kw):
+    from .export import npy
+    return npy.load(directory, columns=[], layer_groups=layer_groups, **kw)["layer_data"]
+
+def _select_layer_groups(keys, layer_groups=None):
+    if layer_groups is None:
+        return list(keys)
+    missing = [key for key in layer_groups if key not in keys]
+    if missing:
+        raise ValueError("Unknown layer groups: %s" % ", ".join(missing))
+    return [key for key in keys if key in layer_groups]
 
 def df_to_dict_tree(df):
     if (df.index.nlevels==1):
@@ -83,15 +103,47 @@ class XYZ(object):
 
     xyz = XYZ(source, **kw)
 
-    Where source can be a filename to parse, or an already parsed
-    model dictionary (in the same format returned by xyz.to_dict()).
+    Where source can be a filename to parse, a list of filenames to
+    parse and combine (see libaarhusxyz.xyzparser.parse_many()), or an
+    already parsed model dictionary (in the same format returned by
+    xyz.to_dict()).
 
     Where kw can be:
 
     alcfile=filename
       Read column mappings from filename (a .ALC file)
-    normalize=bool (default False)
-      Normalize data after reading.
+    engine="auto", "c", "python" or "mmap" (default "auto")
+      Tokenizer to use for the data section, see
+      libaarhusxyz.xyzparser.parse()
+    columns=list, layer_groups=list (default None)
+      Only read these flightlines columns / layer_data groups
+    workers=int (default 1)
+      Number of processes to parse the file (or list of files) with
+    lines=list (default None)
+      Only read these flight lines, using a .xyzidx index file
+    dtype_policy="default" or "compact" (default "default")
+      Store layer data as float32, line ids as int32 / categorical and
+      text as Arrow strings, see libaarhusxyz.xyzparser.apply_dtype_policy()
+    cache=bool or "hash", cache_dir=str (default False, None)
+      Cache the parsed file on disk, see libaarhusxyz.xyzparser.parse()
+    layer_blocks=bool (default False)
+      Store layer_data as a libaarhusxyz.layerdata.LayerData, with
+      groups of the same shape and dtype in one (soundings x layers x
+      groups) array, so that sorting, splitting and concatenating rows
+      is one array operation per block
+    lazy=bool (default False)
+      Only parse the header and flightlines, and read each layer_data
+      group when it is first accessed, see
+      libaarhusxyz.layerdata.LazyLayerData. Needs a file path (and
+      alcfile path). Can not be combined with layer_blocks.
+    normalize=bool or "lazy" (default False)
+      Normalize data after reading. With "lazy", only naming is
+      normalized, and derived columns / layer_data groups (e.g. xdist,
+      z_top) are calculated when first accessed as attributes or
+      through xyz.ensure(), see libaarhusxyz.normalizer.normalize()
+    nan_dummy=bool (default normalize, unless nan_value is given)
+      Read the dummy value of the file as NaN while parsing, see
+      libaarhusxyz.xyzparser.parse()
     extra_mappings=dict, str, or DataFrame (default None)
       Custom column name mappings for normalization. Can be:
       - dict: {input_name: canonical_name} e.g. {"Res": "resistivity", "Thick": "height"}
@@ -103,26 +155,49 @@ class XYZ(object):
     libaarhusxyz.normalizer.normalize()
 
     """
+    # State of normalizer.normalize(), None until normalized
+    _normalization = None
+
     def __new__(cls, *arg, **kw):
 
         normalize = kw.pop("normalize", False)
         alcfile = kw.pop("alcfile", None)
+        engine = kw.pop("engine", "auto")
+        columns = kw.pop("columns", None)
+        layer_groups = kw.pop("layer_groups", None)
+        workers = kw.pop("workers", 1)
+        lines = kw.pop("lines", None)
+        dtype_policy = kw.pop("dtype_policy", "default")
+        cache = kw.pop("cache", False)
+        cache_dir = kw.pop("cache_dir", None)
         drop_apply_idx = kw.pop("drop_apply_idx", True)
+        layer_blocks = kw.pop("layer_blocks", False)
+        lazy = kw.pop("lazy", False)
+        nan_dummy = kw.pop("nan_dummy", None)
+        if nan_dummy is None:
+            nan_dummy = normalize and kw.get("nan_value") is None
+        if lazy and layer_blocks:
+            raise ValueError("lazy and layer_blocks can not be combined")
         self = object.__new__(cls)
         if arg:
             if isinstance(arg[0], XYZ):
-                layer_datas = set().union(*[xyz.layer_data.keys() for xyz in arg])
                 model_info = {}
                 for xyz in reversed(arg):
                     model_info.update(xyz.model_info)
-                
-                self.model_dict = {
-                    "flightlines": pd.concat([xyz.flightlines for xyz in arg]),
-                    "layer_data": {
+
+                if all(isinstance(xyz.layer_data, layerdata.LayerData) for xyz in arg):
+                    layer_data = layerdata.concat([xyz.layer_data for xyz in arg])
+                else:
+                    layer_datas = set().union(*[xyz.layer_data.keys() for xyz in arg])
+                    layer_data = {
                         key: pd.concat([xyz.layer_data[key] for xyz in arg
                                         if key in xyz.layer_data])
                         for key in layer_datas
-                    },
+                    }
+                
+                self.model_dict = {
+                    "flightlines": pd.concat([xyz.flightlines for xyz in arg]),
+                    "layer_data": layer_data,
                     "model_info": model_info
                 }
 
@@ -130,22 +205,51 @@ class XYZ(object):
                     
                     apply_idx = self.flightlines.apply_idx
                     ordering = apply_idx.argsort()
-                    self.layer_data = {ld_key: self.layer_data[ld_key].iloc[ordering].reset_index(drop=True)
-                                       for ld_key in self.layer_data.keys()}
+                    self.layer_data = layerdata.take(self.layer_data, ordering)
                     self.flightlines = self.flightlines.iloc[ordering].reset_index(drop=True)
                     if drop_apply_idx:
                         self.flightlines = self.flightlines.drop(columns='apply_idx')
 
             elif isinstance(arg[0], dict):
                 self.model_dict = arg[0]
+            elif isinstance(arg[0], (list, tuple)):
+                if lazy:
+                    raise ValueError("lazy=True can not be used with several files")
+                self.model_dict = parse_many(arg[0], alcfile=alcfile, engine=engine,
+                                             columns=columns, layer_groups=layer_groups,
+                                             workers=workers, lines=lines,
+                                             dtype_policy=dtype_policy, nan_dummy=nan_dummy,
+                                             cache=cache, cache_dir=cache_dir)
+            elif lazy:
+                if not isinstance(arg[0], str) or not (alcfile is None or isinstance(alcfile, str)):
+                    raise ValueError("lazy=True needs file paths, not open files")
+                parse_kw = dict(alcfile=alcfile, engine=engine, workers=workers, lines=lines,
+                                dtype_policy=dtype_policy, cache=cache, cache_dir=cache_dir,
+                                nan_dummy=nan_dummy)
+                self.model_dict = parse(arg[0], columns=columns, layer_groups=[], **parse_kw)
+                keys = _select_layer_groups(parse_header(arg[0], alcfile=alcfile)["layer_data"].keys(),
+                                            layer_groups)
+                self.layer_data = layerdata.LazyLayerData(
+                    keys, functools.partial(_parse_layer_groups, arg[0], **parse_kw))
             else:
-                self.model_dict = parse(arg[0], alcfile=alcfile)
+                self.model_dict = parse(arg[0], alcfile=alcfile, engine=engine,
+                                        columns=columns, layer_groups=layer_groups,
+                                        workers=workers, lines=lines,
+                                        dtype_policy=dtype_policy,
+                                        cache=cache, cache_dir=cache_dir,
+                                        nan_dummy=nan_dummy)
         else:
             self.model_dict = {"flightlines": pd.DataFrame(columns=["line_no", "x", "y"]),
                                "model_info": {},
                                "layer_data": {}}
+        if layer_blocks and not isinstance(self.layer_data, layerdata.LayerData):
+            self.layer_data = layerdata.LayerData(self.layer_data)
         if normalize:
-            self.normalize(**kw)
+            self.normalize(lazy=normalize == "lazy", **kw)
+            if layer_blocks:
+                # Normalization replaces most groups, so store them in blocks again
+                self.layer_data = layerdata.LayerData(self.layer_data)
+                normalizer._refresh_fingerprints(self)
         return self
 
     def normalize(self, **kw):
@@ -161,6 +265,13 @@ class XYZ(object):
         """
         normalizer.normalize(self, **kw)
 
+    def ensure(self, *names):
+        """Calculate the derived columns / layer_data groups names
+        (e.g. "xdist", "z_top", see normalizer.NORMALIZE_OUTPUTS),
+        only running the normalization steps that are needed and not
+        already up to date."""
+        normalizer.ensure(self, *names)
+
     def normalize_naming(self, naming_standard="libaarhusxyz", extra_mappings=None):
         normalizer.normalize_naming(self, naming_standard, extra_mappings=extra_mappings)
     def normalize_nans(self, nan_value=None):
@@ -169,8 +280,8 @@ class XYZ(object):
         normalizer.normalize_projection(self)
     def normalize_coordinates(self, project_crs=None):
         normalizer.normalize_coordinates(self, project_crs)
-    def normalize_dates(self):
-        normalizer.normalize_dates(self)
+    def normalize_dates(self, date_format=None, time_format=None):
+        normalizer.normalize_dates(self, date_format, time_format)
 
     def normalize_sort_datetime(self):
         normalizer.normalize_sort_datetime(self)
@@ -189,8 +300,26 @@ class XYZ(object):
         normalizer.calculate_height(self)
     def calculate_doi_layer(self):
         normalizer.calculate_doi_layer(self)
+
+    def resample_layers(self, boundaries, method="nearest", elevation=False):
+        """Returns a copy with all layer_data parameters resampled onto
+        a grid of cells, see libaarhusxyz.transforms.resample_layers().
+
+        elevation: if True, boundaries are elevations, relative to the
+        topography in z_column.
+        """
+        if elevation:
+            if self.z_column is None:
+                raise ValueError("No topography column to resample in elevation")
+            elevation = self.z_column
+        else:
+            elevation = None
+        model_dict = transforms.resample_layers(self.model_dict, boundaries, method=method, elevation=elevation)
+        model_dict["flightlines"] = model_dict["flightlines"].copy()
+        model_dict["model_info"] = dict(model_dict.get("model_info", {}))
+        return type(self)(model_dict)
         
-    def dump(self, nameorfile, alcfile=None):
+    def dump(self, nameorfile, alcfile=None, **kw):
         """Write to XYZ file.
 
         nameorfile: either a file path as a string, or an open file object
@@ -199,8 +328,11 @@ class XYZ(object):
         alcfile: optional file path or open file object to write a
         Aarhus Workbench style ALC file with column mappings to.
 
+        precision: optional number of significant digits or % format
+        of float columns, see libaarhusxyz.xyzparser.dump()
+
         """
-        _dump_function(self.model_dict, nameorfile, alcfile=alcfile)
+        _dump_function(self.model_dict, nameorfile, alcfile=alcfile, **kw)
 
     def to_geojson(self, nameorfile, *arg, **kw):
         from .export import geojson
@@ -210,6 +342,59 @@ class XYZ(object):
         from .export import msgpack
         msgpack.dump(self, nameorfile, *arg, **kw)
         
+    def to_parquet(self, nameorfile, **kw):
+        """Write to a Parquet file, with each layer_data group as a
+        fixed size list column, see
+        libaarhusxyz.export.arrow.dump_parquet()"""
+        from .export import arrow
+        arrow.dump_parquet(self, nameorfile, **kw)
+
+    @classmethod
+    def from_parquet(cls, nameorfile, **kw):
+        """Read a Parquet file written by to_parquet(). Takes the
+        optional projection arguments columns, layer_groups and
+        row_groups, see libaarhusxyz.export.arrow.load_parquet()"""
+        from .export import arrow
+        return cls(arrow.load_parquet(nameorfile, **kw))
+
+    def to_feather(self, nameorfile, **kw):
+        """Write to an Arrow IPC (Feather v2) file, see
+        libaarhusxyz.export.arrow.dump_feather()"""
+        from .export import arrow
+        arrow.dump_feather(self, nameorfile, **kw)
+
+    @classmethod
+    def from_feather(cls, nameorfile, **kw):
+        """Read an Arrow IPC (Feather v2) file written by to_feather(),
+        see libaarhusxyz.export.arrow.load_feather()"""
+        from .export import arrow
+        return cls(arrow.load_feather(nameorfile, **kw))
+
+    def to_npy(self, directory):
+        """Write to a directory of .npy files, one per flightlines
+        column and one per layer_data group, see
+        libaarhusxyz.export.npy"""
+        from .export import npy
+        npy.dump(self, directory)
+
+    @classmethod
+    def open(cls, directory, mmap=True, lazy=False, **kw):
+        """Open a directory written by to_npy(). With mmap=True
+        (default) the numeric data is memory mapped rather than read.
+        Takes the optional projection arguments columns and
+        layer_groups, see libaarhusxyz.export.npy.load(). With
+        lazy=True, layer_data groups are only loaded when first
+        accessed."""
+        from .export import npy
+        if not lazy:
+            return cls(npy.load(directory, mmap=mmap, **kw))
+        layer_groups = kw.pop("layer_groups", None)
+        self = cls(npy.load(directory, mmap=mmap, layer_groups=[], **kw))
+        keys = _select_layer_groups(npy.load_meta(directory)["layer_data"].keys(), layer_groups)
+        self.layer_data = layerdata.LazyLayerData(
+            keys, functools.partial(_load_layer_groups, directory, mmap=mmap))
+        return self
+
     def to_vtk(self, nameorfile, *arg, **kw):
         """Write a 3d model to VTK file (only works for resistivity models,
         not data!).
@@ -276,7 +461,7 @@ class XYZ(object):
             return pd.DataFrame({"layer": []})
         layer_constants = pd.DataFrame(index=next(iter(layer_dfs.values())).columns)
         for key, layer_df in layer_dfs.items():
-            if (layer_df.dtypes == float).all():
+            if all(pd.api.types.is_float_dtype(dtype) for dtype in layer_df.dtypes):
                 if (layer_df.max() - layer_df.min()).max() == 0.0:
                     layer_constants[key] = layer_df.iloc[0]
         return layer_constants.reset_index().rename(columns={"index": "layer"})
@@ -314,16 +499,25 @@ class XYZ(object):
                 return self.model_info[name]
             if name in self.layer_data:
                 return self.layer_data[name]
-            if name in self.layer_params:
-                return self.layer_params[name]
-
+            # Checked before layer_params, which reads all (lazy) layer_data groups
             if name.endswith("_column"):
                 return self.get_column(name.split("_column")[0])
+            if self._normalization is not None and name in normalizer.NORMALIZE_OUTPUTS:
+                # Calculated on first access after normalize(lazy=True)
+                self.ensure(name)
+                if name in self.layer_data:
+                    return self.layer_data[name]
+                if name in self.flightlines.columns:
+                    return self.flightlines[name]
+            if name in self.layer_params:
+                return self.layer_params[name]
             
         raise AttributeError(name)
     
     def __setattr__(self, name, value):
-        if name not in ("model_dict", "model_info", "layer_data", "layer_params"):
+        if (name not in ("model_dict", "model_info", "layer_data", "layer_params")
+            and not name.startswith("_")
+            and not isinstance(getattr(type(self), name, None), property)):
             if name in self.model_info:
                 self.model_info[name] = value
             if name in self.layer_data:
@@ -599,7 +793,10 @@ class XYZ(object):
                 if dataset in res.layer_data:
                     del res.layer_data[dataset]
             else:
-                df_apply(res.layer_data[dataset], datasetdiff, rows, dummy_value = dummy_value)
+                df = res.layer_data[dataset]
+                df_apply(df, datasetdiff, rows, dummy_value = dummy_value)
+                # Write back in case the update could not be done in place in a LayerData block
+                res.layer_data[dataset] = df
 
         return res
 
@@ -621,9 +818,7 @@ class XYZ(object):
         for fline in flines_list:
             filt = self.flightlines[self.line_id_column] == fline
             line_xyz = type(self)(self)
-            line_xyz.layer_data = {
-                ld_key: line_xyz.layer_data[ld_key].loc[filt].reset_index(drop=True)
-                for ld_key in line_xyz.layer_data.keys()}
+            line_xyz.layer_data = layerdata.take(line_xyz.layer_data, filt.values)
             line_xyz.flightlines = line_xyz.flightlines.loc[filt]
             if "apply_idx" in line_xyz.flightlines.columns:
                 line_xyz.flightlines = line_xyz.flightlines.reset_index(drop=True)
@@ -2,14 +2,28 @@
 
 import pandas as pd
 import numpy as np
+import concurrent.futures
 import copy
+import csv
+import functools
+import io
+import json
+import mmap
+import os
 import re
 try:
     import projnames
 except:
     projnames = None
+try:
+    import pyarrow
+except:
+    pyarrow = None
 from . import transforms
 from . import alc
+from . import compression
+from . import cache as _cache
+from . import profiling
 
 _RE_FLOATS = re.compile(r"^ *([-+]?[0-9]*(\.[0-9]*)?([eE][-+]?[0-9]+)?)(\s+[-+]?[0-9]*(\.[0-9]*)?([eE][-+]?[0-9]+)?)*$")
 _RE_INTS = re.compile(r"^ *([-+]?[0-9]+)(\s+[-+]?[0-9]+)*$")
@@ -30,6 +44,157 @@ _RE_ALL_NUMBERED_COL = re.compile(r"^(.*?)[(_\[]?([0-9]+)[)\]]?$")
 _NA_VALUES = ["", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN", "<NA>",
              "N/A", "NA", "NULL", "NaN", "n/a", "nan", "null", "*"]
 
+# Column separator of the data section: whitespace, optionally preceded by a comma
+_RE_SEPARATOR = r",?[\s]+"
+_SEPARATOR_COMMAS = [("," + ws, " " + ws) for ws in " \t\r\n"]
+
+ENGINES = ("auto", "c", "python")
+
+# Data lines, as opposed to comments, Line / Tie separators and blank lines (see _is_data_line())
+_RE_DATA_LINE = re.compile(rb"^[ \t]*(?!/|Line|Tie)\S[^\n]*", re.M)
+_MMAP_BLOCKSIZE = 16 * 1024 * 1024
+
+# Column names used to split files by flight line, in order of priority
+_LINE_ID_COLUMNS = ("title", "line", "line_id", "line_no")
+
+def _replace_separator_commas(data):
+    if "," in data:
+        for comma, replacement in _SEPARATOR_COMMAS:
+            data = data.replace(comma, replacement)
+    return data
+
+class _SeparatorFilter(object):
+    """Read-only file wrapper that replaces the optional comma of
+    _RE_SEPARATOR with a space, so that the data section can be
+    tokenized on whitespace alone by the pandas C engine. The python
+    engine reads it too, so that commas at the end of rows (e.g. in
+    Aarhus Workbench 6.7 AVG / RAW exports) are dropped by both."""
+    def __init__(self, f):
+        self.f = f
+        self.pending = ""
+
+    def read(self, size=-1):
+        data = self.pending + self.f.read(size)
+        self.pending = ""
+        if size is not None and size > 0 and data.endswith(","):
+            # The comma might be followed by whitespace in the next chunk
+            data, self.pending = data[:-1], ","
+        return _replace_separator_commas(data)
+
+    def readline(self, size=-1):
+        # Used by the python engine, which needs whole lines
+        line = self.pending + self.f.readline(size)
+        self.pending = ""
+        return _replace_separator_commas(line)
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        line = self.readline()
+        if not line:
+            raise StopIteration
+        return line
+
+def _read_csv(inputfile, engine, col_names, na_values, **kw):
+    if engine == "c":
+        return pd.read_csv(_SeparatorFilter(inputfile), sep=r"\s+", names=col_names, na_values=na_values,
+                           quoting=csv.QUOTE_NONE, float_precision="round_trip", engine="c", **kw)
+    return pd.read_csv(_SeparatorFilter(inputfile), sep=_RE_SEPARATOR, names=col_names, na_values=na_values,
+                       engine="python", **kw)
+
+def _check_engine(engine):
+    if engine not in ENGINES:
+        raise ValueError("Unknown engine %s, must be one of %s" % (engine, ", ".join(ENGINES)))
+
+def _is_data_line(line):
+    line = line.strip()
+    return bool(line) and not line.startswith("/") and not line.startswith("Line") and not line.startswith("Tie")
+
+def _data_fields(inputfile):
+    """Returns the number of fields of the first data row after the
+    current position of inputfile (None if there is none), leaving
+    the position unchanged."""
+    pos = inputfile.tell()
+    try:
+        for line in iter(inputfile.readline, ""):
+            if _is_data_line(line):
+                return len(re.split(_RE_SEPARATOR, line.strip()))
+        return None
+    finally:
+        inputfile.seek(pos)
+
+def _fields_in_data(inputfile, col_names, usecols):
+    """Some files have fewer fields in their data rows than columns
+    in their header. Without usecols, pandas reads the missing
+    trailing columns as NaN, but it refuses usecols beyond the last
+    field. Returns the number of fields if any of usecols is beyond
+    the last one, and None otherwise."""
+    if usecols is None:
+        return None
+    nfields = _data_fields(inputfile)
+    if nfields is None or nfields >= len(col_names) or max(usecols) < nfields:
+        return None
+    return nfields
+
+def _read_data(inputfile, col_names, na_values, engine="auto", **kw):
+    """Tokenizes the data section of an XYZ file, starting at the
+    current position of inputfile. Returns the raw DataFrame
+    (including any line separator and comment rows) and the name of
+    the pandas engine that was used.
+
+    engine="auto" uses the C engine, and falls back to the (much
+    slower) regex based python engine only if the file is irregular,
+    e.g. has rows with more columns than the header.
+    """
+    _check_engine(engine)
+    nfields = _fields_in_data(inputfile, col_names, kw.get("usecols"))
+    if nfields is not None:
+        usecols = kw.pop("usecols")
+        df, engine = _read_data(inputfile, col_names[:nfields], na_values, engine,
+                                usecols=[idx for idx in usecols if idx < nfields], **kw)
+        return df.reindex(columns=[col_names[idx] for idx in usecols]), engine
+    if engine in ("auto", "c"):
+        pos = inputfile.tell()
+        try:
+            return _read_csv(inputfile, "c", col_names, na_values, **kw), "c"
+        except pd.errors.ParserError:
+            if engine == "c":
+                raise
+        inputfile.seek(pos)
+    return _read_csv(inputfile, "python", col_names, na_values, **kw), "python"
+
+def _read_data_chunks(inputfile, col_names, na_values, engine="auto", chunksize=100000, **kw):
+    """Like _read_data(), but yields (DataFrame, engine) tuples with at
+    most chunksize rows each. With engine="auto", the python engine is
+    only used if the C engine fails on the first chunk."""
+    _check_engine(engine)
+    nfields = _fields_in_data(inputfile, col_names, kw.get("usecols"))
+    if nfields is not None:
+        usecols = kw.pop("usecols")
+        names = [col_names[idx] for idx in usecols]
+        for chunk, chunk_engine in _read_data_chunks(inputfile, col_names[:nfields], na_values, engine, chunksize,
+                                                     usecols=[idx for idx in usecols if idx < nfields], **kw):
+            yield chunk.reindex(columns=names), chunk_engine
+        return
+    if engine in ("auto", "c"):
+        pos = inputfile.tell()
+        reader = _read_csv(inputfile, "c", col_names, na_values, chunksize=chunksize, **kw)
+        try:
+            first = next(reader, None)
+        except pd.errors.ParserError:
+            if engine == "c":
+                raise
+        else:
+            if first is not None:
+                yield first, "c"
+                for chunk in reader:
+                    yield chunk, "c"
+            return
+        inputfile.seek(pos)
+    for chunk in _read_csv(inputfile, "python", col_names, na_values, chunksize=chunksize, **kw):
+        yield chunk, "python"
+
 def _transfer_per_location_cols_with_numerical_suffix(colgroups, per_sounding_cols, ambiguous_groups):
     """
     Search through the dictionary colgroups. If any list of columns has a length of only 1, parse this as a
@@ -60,13 +225,21 @@ def _transfer_per_location_cols_with_numerical_suffix(colgroups, per_sounding_co
     for group_name in groups_to_delete: colgroups.pop(group_name)
     return colgroups, per_sounding_cols
 
-def _split_layer_columns(df):
-    per_layer_cols = [col for col in df.columns if re.match(_RE_LAYER_COL_WITH_SEPARATOR, col)]
+def _layer_column_groups(columns):
+    """Groups column names into per sounding columns and layer
+    groups. Returns a list of per sounding columns and a dictionary of
+    group_name: (group_columns, {column: layer}).
+
+    This only depends on the column names, so it can be computed
+    once and reused for any number of chunks of the same file.
+    """
+    columns = list(columns)
+    per_layer_cols = [col for col in columns if re.match(_RE_LAYER_COL_WITH_SEPARATOR, col)]
 
-    all_numbered_cols = [col for col in df.columns if re.match(_RE_ALL_NUMBERED_COL, col)]
+    all_numbered_cols = [col for col in columns if re.match(_RE_ALL_NUMBERED_COL, col)]
     ambiguous_cols = [col for col in all_numbered_cols if col not in per_layer_cols]
 
-    per_sounding_cols = [col for col in df.columns if (not col in per_layer_cols) and (not col in ambiguous_cols)]
+    per_sounding_cols = [col for col in columns if (not col in per_layer_cols) and (not col in ambiguous_cols)]
 
     colgroups = {}
     for col in per_layer_cols:
@@ -93,15 +266,26 @@ def _split_layer_columns(df):
         layers = np.array([int(match.groups()[1]) if match else -1 for match in matches])
         layers -= np.min(layers)
         return dict(zip(columns, layers))
-        
-    colgroups = {key.strip("_"):
-                 df[columns].rename(
-                     columns = columns_to_layers(columns))
+
+    colgroups = {key.strip("_"): (columns, columns_to_layers(columns))
                  for key, columns in colgroups.items()}
 
+    return per_sounding_cols, colgroups
+
+def _split_layer_columns(df, groups=None):
+    if groups is None:
+        groups = _layer_column_groups(df.columns)
+    per_sounding_cols, colgroups = groups
+
+    colgroups = {key: df[columns].rename(columns = layers)
+                 for key, (columns, layers) in colgroups.items()}
+
     return df[per_sounding_cols], colgroups
 
-def _parse(inputfile, source=None, alcfile=None, **kw):
+def _parse_header(inputfile):
+    """Reads the /-prefixed header lines of an XYZ file, leaving
+    inputfile positioned at the first data line. Returns the header
+    values (as strings) and the column names."""
     headers = {}
     
     name = None
@@ -149,11 +333,31 @@ def _parse(inputfile, source=None, alcfile=None, **kw):
             headers[name] = line
             name = None
 
+    return headers, col_names
+
+def _convert_header_values(headers):
+    for key, value in headers.items():
+        if " " in value and re.match(_RE_INTS, value):
+            headers[key] = [int(item) for item in re.split(r"\s+", value)]
+        elif " " in value and re.match(_RE_FLOATS, value):
+            headers[key] = [float(item) for item in re.split(r"\s+", value)]
+        elif value and re.match(_RE_FLOAT, value):
+            headers[key] = float(value)
+        elif re.match(_RE_INT, value):
+            headers[key] = int(value)            
+    return headers
+
+def _na_values(headers, nan_dummy=False):
+    """Tokens read as NaN: the usual ones and *, and with nan_dummy,
+    also the dummy value of the file header."""
     na_values = _NA_VALUES
-    if "dummy" in headers:
-        na_values + na_values + [headers["dummy"]]
-    full_df = pd.read_csv(inputfile, sep = ",?[\s]+", names = col_names, na_values=na_values, engine = 'python')
+    if nan_dummy and "dummy" in headers:
+        na_values = na_values + [headers["dummy"]]
+    return na_values
 
+def _clean_data(full_df):
+    """Drops line separator (Line / Tie) and comment rows, and converts
+    all columns that can be converted to numbers."""
     line_separators = (full_df[full_df.columns[0]] == "Line") | (full_df[full_df.columns[0]] == "Tie")
     if full_df[full_df.columns[0]].dtype == "O":
         comments = full_df[full_df.columns[0]].str.match(r"^\s*/")
@@ -167,60 +371,887 @@ def _parse(inputfile, source=None, alcfile=None, **kw):
             full_df[c] = pd.to_numeric(full_df[c])
         except:
             pass
-    
-    for key, value in headers.items():
-        if " " in value and re.match(_RE_INTS, value):
-            headers[key] = [int(item) for item in re.split(r"\s+", value)]
-        elif " " in value and re.match(_RE_FLOATS, value):
-            headers[key] = [float(item) for item in re.split(r"\s+", value)]
-        elif value and re.match(_RE_FLOAT, value):
-            headers[key] = float(value)
-        elif re.match(_RE_INT, value):
-            headers[key] = int(value)            
+    return full_df
+
+def _alc_column_mapping(alcdata):
+    mapping = alcdata["mapping"].loc[alcdata["mapping"].position >= 0]
+    return mapping.set_index("column")["canonical_name"].to_dict()
 
+def _file_columns(col_names, alcfile=None, columns=None, layer_groups=None):
+    """Resolves the column names of a file, after any ALC column
+    mapping, and groups them into per sounding columns and layer
+    groups. If columns and / or layer_groups are given, only those
+    flightlines columns / layer_data groups are kept.
+
+    Returns the column names, the parsed ALC file (or None), the
+    positions of the columns that need to be read (None for all of
+    them) and the (projected) column grouping.
+    """
+    names = pd.Index(col_names)
     alcdata = None
     if alcfile is not None:
-        alcdata = alc.parse(alcfile, full_df.columns)
-        mapping = alcdata["mapping"].loc[alcdata["mapping"].position >= 0]
-        mapping = mapping.set_index("column")["canonical_name"].to_dict()
-        full_df = full_df.rename(columns=mapping)
-        
-    df, layer_dfs = _split_layer_columns(full_df)
+        alcdata = alc.parse(alcfile, names)
+        mapping = _alc_column_mapping(alcdata)
+        names = names.map(lambda col: mapping.get(col, col))
+    per_sounding_cols, colgroups = _layer_column_groups(names)
 
-    headers["source"] = source
+    if columns is None and layer_groups is None:
+        return names, alcdata, None, (per_sounding_cols, colgroups)
+
+    if columns is not None:
+        missing = [col for col in columns if col not in per_sounding_cols]
+        if missing:
+            raise ValueError("Unknown columns: %s" % ", ".join(missing))
+        per_sounding_cols = [col for col in per_sounding_cols if col in columns]
+    if layer_groups is not None:
+        missing = [key for key in layer_groups if key not in colgroups]
+        if missing:
+            raise ValueError("Unknown layer groups: %s" % ", ".join(missing))
+        colgroups = {key: value for key, value in colgroups.items() if key in layer_groups}
+
+    selected = set(per_sounding_cols).union(*[group_cols for group_cols, layers in colgroups.values()])
+    # The first column is always read, as it is used to find Line / Tie separators and comments
+    usecols = [idx for idx, col in enumerate(names) if idx == 0 or col in selected]
+    return names, alcdata, usecols, (per_sounding_cols, colgroups)
+
+def _make_model(full_df, headers, file_meta, alcdata=None, groups=None):
+    if groups is None:
+        groups = _layer_column_groups(full_df.columns)
+    df, layer_dfs = _split_layer_columns(full_df, groups)
+
+    per_sounding_cols, colgroups = groups
+    selected = set(per_sounding_cols).union(*[group_cols for group_cols, layers in colgroups.values()])
 
     res = {"flightlines": df,
             "layer_data": layer_dfs,
             "model_info": headers,
-            "file_meta": {"columns": list(full_df.columns)}}
+            "file_meta": dict(file_meta, columns=[col for col in full_df.columns if col in selected])}
 
     if alcdata is not None:
         res["alc_info"] = alcdata["meta"]
         
     return res
+
+def _parse(inputfile, source=None, alcfile=None, engine="auto", columns=None, layer_groups=None, nan_dummy=False, **kw):
+    with profiling.stage("parse.header"):
+        headers, col_names = _parse_header(inputfile)
+        na_values = _na_values(headers, nan_dummy)
+        _convert_header_values(headers)
+        headers["source"] = source
+
+        names, alcdata, usecols, groups = _file_columns(col_names, alcfile, columns, layer_groups)
+
+    with profiling.stage("parse.tokenize") as info:
+        full_df, engine = _read_data(inputfile, col_names, na_values, engine, usecols=usecols)
+        info["rows"] = len(full_df)
+    with profiling.stage("parse.convert", rows=len(full_df)):
+        full_df = _clean_data(full_df.set_axis(names if usecols is None else names[usecols], axis=1))
+
+    with profiling.stage("parse.split", rows=len(full_df)):
+        return _make_model(full_df, headers, {"engine": engine}, alcdata, groups)
     
+def _data_ranges(filename, nranges):
+    """Splits the data section of an XYZ file into at most nranges
+    (start, end) byte ranges, aligned to line endings."""
+    with open(filename, "rb") as f:
+        while True:
+            start = f.tell()
+            if not f.readline().startswith(b"/"):
+                break
+        size = os.path.getsize(filename)
+        bounds = [start]
+        for idx in range(1, nranges):
+            f.seek(start + (size - start) * idx // nranges)
+            f.readline()
+            if f.tell() > bounds[-1]:
+                bounds.append(f.tell())
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if end > start]
+
+def _parse_range(filename, start, end, col_names, read_names, na_values, engine, usecols):
+    with open(filename, "rb") as f:
+        f.seek(start)
+        data = io.TextIOWrapper(io.BytesIO(f.read(end - start)))
+    full_df, engine = _read_data(data, col_names, na_values, engine, usecols=usecols)
+    return _clean_data(full_df.set_axis(read_names, axis=1)), engine
+
+def _parse_parallel(filename, alcfile=None, engine="auto", columns=None, layer_groups=None, workers=2, nan_dummy=False, **kw):
+    """Parses the data section of filename in workers processes, each
+    handling a range of lines, and concatenates the results in
+    order."""
+    with profiling.stage("parse.header"):
+        with open(filename, "r") as f:
+            headers, col_names = _parse_header(f)
+        na_values = _na_values(headers, nan_dummy)
+        _convert_header_values(headers)
+        headers["source"] = filename
+
+        names, alcdata, usecols, groups = _file_columns(col_names, alcfile, columns, layer_groups)
+        read_names = names if usecols is None else names[usecols]
+
+    # The workers also convert their ranges, which is only seen as waiting for them
+    with profiling.stage("parse.tokenize") as info:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_parse_range, filename, start, end, col_names, read_names, na_values, engine, usecols)
+                       for start, end in _data_ranges(filename, workers)]
+            results = [future.result() for future in futures]
+        info["rows"] = sum(len(df) for df, engine in results)
+
+    with profiling.stage("parse.convert", rows=info["rows"]):
+        full_df = pd.concat([df for df, engine in results], ignore_index=True)
+        engines = set(engine for df, engine in results)
+        engine = "python" if "python" in engines else "c"
+
+    with profiling.stage("parse.split", rows=len(full_df)):
+        return _make_model(full_df, headers, {"engine": engine}, alcdata, groups)
+
+def _mmap_data_start(mm):
+    """Byte offset of the first data line, i.e. the first line not
+    starting with /, same as where _parse_header() stops."""
+    pos = 0
+    while pos < len(mm) and mm[pos:pos+1] == b"/":
+        end = mm.find(b"\n", pos)
+        if end < 0:
+            return len(mm)
+        pos = end + 1
+    return pos
+
+def _mmap_blocks(mm, start, blocksize=_MMAP_BLOCKSIZE):
+    """Yields (start, end) byte ranges of at most about blocksize
+    bytes, aligned to line endings."""
+    while start < len(mm):
+        end = mm.find(b"\n", min(start + blocksize, len(mm) - 1))
+        end = len(mm) if end < 0 else end + 1
+        yield start, end
+        start = end
+
+def _mmap_read_block(mm, start, end, ncols, dtype, usecols=None, dummy=None):
+    text = mm[start:end]
+    if b"/" in text or b"L" in text or b"T" in text:
+        # Only keep data lines, dropping comments and Line / Tie separators
+        text = b"\n".join(_RE_DATA_LINE.findall(text))
+    if b"," in text:
+        text = text.replace(b",", b" ")
+    if b"*" in text:
+        text = text.replace(b"*", b"nan")
+    if not text.strip():
+        return np.zeros((0, ncols), dtype=dtype)
+    # Blank lines are skipped by loadtxt
+    values = np.loadtxt(text.split(b"\n"), dtype=dtype, ndmin=2, usecols=usecols)
+    if dummy is not None:
+        values[values == dummy] = np.nan
+    return values
+
+def _parse_mmap(filename, alcfile=None, float_dtype=np.float64, columns=None, layer_groups=None, nan_dummy=False, **kw):
+    """Two pass parser for XYZ files with only numeric columns. The
+    first pass counts data rows, the second parses blocks of rows
+    directly into preallocated arrays, one per layer group, and one
+    for the per sounding columns. Returns None if the file is not
+    all numeric or otherwise irregular.
+
+    Integer flightlines columns are detected from the first data row,
+    but layer_data is always float_dtype, also for integer layer
+    columns."""
+    with profiling.stage("parse.header"):
+        with open(filename, "r") as f:
+            headers, col_names = _parse_header(f)
+            # Check the first data row, skipping Line / Tie separators, comments and blank lines
+            for first_line in f:
+                if _is_data_line(first_line):
+                    break
+            else:
+                first_line = ""
+        first_values = first_line.replace(",", " ").split()
+        if len(first_values) != len(col_names):
+            return None
+        for value in first_values:
+            if value != "*" and not re.match(_RE_FLOAT, value) and value.lower() != "nan":
+                return None
+
+        _convert_header_values(headers)
+        headers["source"] = filename
+
+        names, alcdata, usecols, (per_sounding_cols, colgroups) = _file_columns(
+            col_names, alcfile, columns, layer_groups)
+        int_cols = [col for col, value in zip(names, first_values) if re.match(_RE_INT, value)]
+        dummy = headers.get("dummy") if nan_dummy else None
+        if not isinstance(dummy, (int, float)):
+            dummy = None
+        read_names = names if usecols is None else names[usecols]
+        col_idx = {col: idx for idx, col in enumerate(read_names)}
+
+    # Values are converted while tokenizing, straight into the arrays of each group
+    with profiling.stage("parse.tokenize") as info:
+        with open(filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = _mmap_data_start(mm)
+                # Upper bound, as this includes any comments, separators and blank lines
+                nrows = sum(mm[block_start:block_end].count(b"\n") + 1
+                            for block_start, block_end in _mmap_blocks(mm, start))
+
+                flightlines = np.empty((nrows, len(per_sounding_cols)), dtype=np.float64)
+                flightlines_idx = [col_idx[col] for col in per_sounding_cols]
+                layer_data = {key: np.empty((nrows, len(group_cols)), dtype=float_dtype)
+                              for key, (group_cols, layers) in colgroups.items()}
+                layer_data_idx = {key: [col_idx[col] for col in group_cols]
+                                  for key, (group_cols, layers) in colgroups.items()}
+
+                row = 0
+                for block_start, block_end in _mmap_blocks(mm, start):
+                    try:
+                        values = _mmap_read_block(mm, block_start, block_end, len(read_names), np.float64, usecols, dummy)
+                    except ValueError:
+                        return None
+                    if values.shape[1] != len(read_names) or row + len(values) > nrows:
+                        return None
+                    flightlines[row:row+len(values)] = values[:, flightlines_idx]
+                    for key, idx in layer_data_idx.items():
+                        layer_data[key][row:row+len(values)] = values[:, idx]
+                    row += len(values)
+                if row < nrows:
+                    flightlines = flightlines[:row]
+                    layer_data = {key: value[:row] for key, value in layer_data.items()}
+        info["rows"] = row
+
+    with profiling.stage("parse.convert", rows=row):
+        flightlines = pd.DataFrame(flightlines, columns=per_sounding_cols)
+        for col in int_cols:
+            if col in flightlines.columns:
+                values = flightlines[col].values
+                if np.isfinite(values).all() and (values == np.round(values)).all():
+                    flightlines[col] = values.astype(np.int64)
+
+    with profiling.stage("parse.split", rows=row):
+        res = {"flightlines": flightlines,
+               "layer_data": {key: pd.DataFrame(layer_data[key], columns=[layers[col] for col in group_cols])
+                              for key, (group_cols, layers) in colgroups.items()},
+               "model_info": headers,
+               "file_meta": {"columns": per_sounding_cols + [col for group_cols, layers in colgroups.values()
+                                                                     for col in group_cols],
+                             "engine": "mmap"}}
+        if alcdata is not None:
+            res["alc_info"] = alcdata["meta"]
+    return res
+
+def _index_filename(filename):
+    return os.path.splitext(filename)[0] + ".xyzidx"
+
+def _line_key(value):
+    """Line ids are compared as numbers where possible, so that 100101
+    matches both "100101" and "100101.0" in the file."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return str(value)
+
+def _index_line_column(col_names, alcfile=None, line_column=None):
+    """The name and position of the line id column of a file with the
+    columns col_names, after any ALC column mapping."""
+    names = _file_columns(col_names, alcfile)[0]
+    if line_column is None:
+        line_column = _line_id_column(names)
+    return line_column, names.get_loc(line_column) if line_column is not None else None
+
+def build_index(filename, alcfile=None, line_column=None, save=True):
+    """Builds an index of the flight lines in an XYZ file, mapping
+    each line id to byte ranges and row ranges of the file. Each
+    consecutive run of rows with the same line id is one entry in
+    index["lines"], with the keys line, start, end (byte offsets),
+    first_row and rows.
+
+    The line id is read from line_column (default: autodetected, see
+    parse_iter(), after mapping the columns with alcfile, if given),
+    or from Line / Tie separator rows if there is no such column.
+
+    save=True: also write the index to a .xyzidx file next to
+    filename, where parse(filename, lines=[...]) will find it.
+    """
+    if compression.detect(filename) is not None:
+        raise ValueError("Can not index compressed files")
+    with open(filename, "r") as f:
+        headers, col_names = _parse_header(f)
+    line_column, line_pos = _index_line_column(col_names, alcfile, line_column)
+
+    runs = []
+    row = 0
+    line = None
+    with open(filename, "rb") as f:
+        pos = 0
+        for data in f:
+            start = pos
+            pos += len(data)
+            stripped = data.strip()
+            if not stripped or stripped.startswith(b"/"):
+                continue
+            if stripped.startswith(b"Line") or stripped.startswith(b"Tie"):
+                if line_pos is None:
+                    line = stripped.split()[1].decode("utf-8")
+                continue
+            if line_pos is not None:
+                line = stripped.split(None, line_pos + 1)[line_pos].rstrip(b",").decode("utf-8")
+            if runs and runs[-1]["line"] == line and runs[-1]["end"] == start:
+                runs[-1]["end"] = pos
+                runs[-1]["rows"] += 1
+            else:
+                runs.append({"line": line, "start": start, "end": pos, "first_row": row, "rows": 1})
+            row += 1
+
+    stat = os.stat(filename)
+    index = {"size": stat.st_size,
+             "mtime": stat.st_mtime,
+             "line_column": line_column,
+             "line_position": line_pos,
+             "lines": runs}
+    if save:
+        try:
+            with open(_index_filename(filename), "w") as f:
+                json.dump(index, f)
+        except OSError:
+            pass
+    return index
+
+def load_index(filename, **kw):
+    """Returns the flight line index of filename, reading the .xyzidx
+    file if it exists and is up to date, and building (and saving) it
+    otherwise. Arguments are the same as for build_index(). An index
+    of another line id column (e.g. one built without the ALC file
+    mapping the line id column) is not up to date."""
+    try:
+        with open(_index_filename(filename)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        index = None
+    stat = os.stat(filename)
+    if index is not None and index.get("size") == stat.st_size and index.get("mtime") == stat.st_mtime:
+        with open(filename, "r") as f:
+            headers, col_names = _parse_header(f)
+        line_column, line_pos = _index_line_column(col_names, kw.get("alcfile"), kw.get("line_column"))
+        if index.get("line_column") == line_column and index.get("line_position") == line_pos:
+            return index
+    return build_index(filename, **kw)
+
+def _parse_lines(filename, lines, alcfile=None, engine="auto", columns=None, layer_groups=None, line_column=None,
+                 nan_dummy=False, **kw):
+    with profiling.stage("parse.header"):
+        with open(filename, "r") as f:
+            headers, col_names = _parse_header(f)
+        na_values = _na_values(headers, nan_dummy)
+        _convert_header_values(headers)
+        headers["source"] = filename
+
+        names, alcdata, usecols, groups = _file_columns(col_names, alcfile, columns, layer_groups)
+        read_names = names if usecols is None else names[usecols]
+
+        index = load_index(filename, alcfile=alcfile, line_column=line_column)
+        keys = set(_line_key(line) for line in lines)
+        runs = [run for run in index["lines"] if _line_key(run["line"]) in keys]
+        missing = keys - set(_line_key(run["line"]) for run in runs)
+        if missing:
+            raise ValueError("Unknown lines: %s" % ", ".join(str(line) for line in missing))
+
+    with profiling.stage("parse.tokenize") as info:
+        data = []
+        with open(filename, "rb") as f:
+            for run in runs:
+                f.seek(run["start"])
+                data.append(f.read(run["end"] - run["start"]))
+        data = io.TextIOWrapper(io.BytesIO(b"".join(data)))
+
+        full_df, engine = _read_data(data, col_names, na_values, engine, usecols=usecols)
+        info["rows"] = len(full_df)
+    with profiling.stage("parse.convert", rows=len(full_df)):
+        full_df = _clean_data(full_df.set_axis(read_names, axis=1))
+
+    with profiling.stage("parse.split", rows=len(full_df)):
+        return _make_model(full_df, headers, {"engine": engine, "lines": list(lines)}, alcdata, groups)
+
+DTYPE_POLICIES = ("default", "compact")
+
+def _check_dtype_policy(dtype_policy):
+    if dtype_policy not in DTYPE_POLICIES:
+        raise ValueError("Unknown dtype_policy %s, expected one of %s" % (dtype_policy, ", ".join(DTYPE_POLICIES)))
+
+def _model_memory(model):
+    return int(model["flightlines"].memory_usage(deep=True).sum()
+               + sum(df.memory_usage(deep=True).sum() for df in model["layer_data"].values()))
+
+def _compact_line_ids(col):
+    if pd.api.types.is_numeric_dtype(col) and not col.isna().any():
+        if (col == col.round()).all() and col.between(np.iinfo(np.int32).min, np.iinfo(np.int32).max).all():
+            return col.astype(np.int32)
+    return col.astype("category")
+
+def apply_dtype_policy(model, dtype_policy="compact"):
+    """Converts the columns of a model dictionary in place to the dtypes
+    of dtype_policy:
+
+    "default": leave the model as it is.
+
+    "compact": layer_data (including gates) as float32, line ids as
+    int32 (or categorical, if not integers) and text columns as Arrow
+    backed strings (categorical if pyarrow is not installed).
+    Flightlines float columns, such as coordinates, are kept as
+    float64.
+
+    The number of bytes saved is reported in file_meta["memory_saved"].
+    """
+    _check_dtype_policy(dtype_policy)
+    if dtype_policy == "default":
+        return model
+    before = _model_memory(model)
+
+    for key, df in model["layer_data"].items():
+        floats = df.select_dtypes("floating").columns
+        if len(floats) == len(df.columns):
+            model["layer_data"][key] = df.astype(np.float32)
+        elif len(floats):
+            model["layer_data"][key] = df.astype({col: np.float32 for col in floats})
+
+    df = model["flightlines"]
+    line_col = _line_id_column(df.columns)
+    for col in df.columns:
+        if col == line_col:
+            df[col] = _compact_line_ids(df[col])
+        elif df[col].dtype == object:
+            df[col] = df[col].astype("string[pyarrow]" if pyarrow is not None else "category")
+
+    model.setdefault("file_meta", {})
+    model["file_meta"]["dtype_policy"] = dtype_policy
+    model["file_meta"]["memory_saved"] = before - _model_memory(model)
+    return model
+
 def parse(nameorfile, **kw):
+    """Parse an XYZ file into a model dictionary with the keys
+    flightlines, layer_data, model_info and file_meta.
+
+    nameorfile: either a file path as a string, or an open file object.
+
+    alcfile: optional file path or open file object of an Aarhus
+    Workbench style ALC file with column mappings.
+
+    columns: optional list of flightlines columns to read (default
+    all of them).
+
+    layer_groups: optional list of layer_data groups to read (default
+    all of them). Columns not listed are neither converted nor kept.
+
+    engine: "auto" (default), "c", "python" or "mmap". The engine
+    actually used is reported in file_meta["engine"]. "mmap" uses a
+    two pass parser for all numeric files that writes values straight
+    into preallocated arrays, and only works when nameorfile is a file
+    path. It falls back to "auto" for files with text columns, or
+    other irregularities.
+
+    float_dtype: dtype of layer_data for engine="mmap" (default
+    numpy.float64).
+
+    workers: number of processes to use to parse the data section
+    (default 1). Only used when nameorfile is a file path, and not
+    together with engine="mmap".
+
+    lines: optional list of flight line ids to read. Only the byte
+    ranges of those lines are read, using an index of the file that
+    is stored next to it (see build_index()). Only used when
+    nameorfile is a file path.
+
+    dtype_policy: "default" or "compact", see apply_dtype_policy().
+
+    cache: True to cache the parsed model on disk, keyed by the path,
+    size and modification time of the file (and ALC file) and the
+    other arguments, or "hash" to also key it by the file content.
+    file_meta["cache"] is "hit" or "miss". See libaarhusxyz.cache.
+    Only used when nameorfile is a file path.
+
+    cache_dir: directory to cache in (default
+    libaarhusxyz.cache.default_dir()). Implies cache=True.
+
+    cache_size: maximum total size of cache_dir in bytes, beyond which
+    the least recently used entries are removed (default 10GB).
+
+    nan_dummy: also read the dummy value of the file header (e.g.
+    9999) as NaN while tokenizing, not just * (default False).
+    file_meta["nan_dummy"] is then True, and normalize_nans() has
+    nothing left to do.
+    """
+    dtype_policy = kw.pop("dtype_policy", "default")
+    _check_dtype_policy(dtype_policy)
+    cache = kw.pop("cache", False)
+    cache_dir = kw.pop("cache_dir", None)
+    cache_size = kw.pop("cache_size", _cache.DEFAULT_MAX_SIZE)
+    with profiling.stage("parse") as info:
+        if (cache or cache_dir) and isinstance(nameorfile, str):
+            model = _cache.cached_parse(_parse_any, nameorfile, cache_dir=cache_dir, max_size=cache_size,
+                                        content_hash=cache == "hash", **kw)
+        else:
+            model = _parse_any(nameorfile, **kw)
+        if kw.get("nan_dummy"):
+            model["file_meta"]["nan_dummy"] = True
+        model = apply_dtype_policy(model, dtype_policy)
+        info["rows"] = len(model["flightlines"])
+    return model
+
+def _parse_any(nameorfile, **kw):
+    if isinstance(nameorfile, str) and compression.detect(nameorfile) is not None:
+        # Byte ranges and memory mapping need an uncompressed file, so stream through the codec
+        if kw.get("lines") is not None:
+            raise ValueError("lines can not be used with compressed files")
+        if kw.get("engine") == "mmap":
+            kw["engine"] = "auto"
+        with compression.open_file(nameorfile, 'r') as f:
+            return _parse(f, source=nameorfile, **kw)
     if isinstance(nameorfile, str):
+        if kw.get("lines") is not None:
+            return _parse_lines(nameorfile, **kw)
+        if kw.get("workers", 1) > 1 and kw.get("engine") != "mmap":
+            return _parse_parallel(nameorfile, **kw)
+        if kw.get("engine") == "mmap":
+            alcfile = kw.get("alcfile")
+            alcpos = alcfile.tell() if hasattr(alcfile, "tell") else None
+            res = _parse_mmap(nameorfile, **kw)
+            if res is not None:
+                return res
+            if alcpos is not None:
+                alcfile.seek(alcpos)
+            kw["engine"] = "auto"
         with open(nameorfile, 'r') as f:
             return _parse(f, source=nameorfile, **kw)
     else:
+        if kw.get("engine") == "mmap":
+            kw["engine"] = "auto"
         return _parse(nameorfile, **kw)
 
-def _un_split_layer_columns(data):
-    if len(data['layer_data']) == 0:
-        return data['flightlines']
-    data=data.copy()
-    flightlines= data['flightlines']
-    dic={}
-    for key, value in data['layer_data'].items():
-        dic[key] = value
-        dic[key].columns= [key + '_' + "{:02d}".format(col+1) for col in dic[key].columns]
-    merge_layers = pd.concat(dic.values(), axis=1)
-    merge_dfs= pd.concat((flightlines, merge_layers), axis=1)
-    return merge_dfs
-
-def _dump(data, file, alcfile=None):
-    df = _un_split_layer_columns(data)
+def _check_schemas(paths, models):
+    first = models[0]
+    for path, model in zip(paths[1:], models[1:]):
+        if set(model["flightlines"].columns) != set(first["flightlines"].columns):
+            raise ValueError("Flightlines columns of %s differ from those of %s: %s" % (
+                path, paths[0], ", ".join(sorted(set(model["flightlines"].columns).symmetric_difference(
+                    first["flightlines"].columns)))))
+        if set(model["layer_data"].keys()) != set(first["layer_data"].keys()):
+            raise ValueError("Layer data of %s differ from those of %s: %s" % (
+                path, paths[0], ", ".join(sorted(set(model["layer_data"].keys()).symmetric_difference(
+                    first["layer_data"].keys())))))
+        for key, df in first["layer_data"].items():
+            if list(model["layer_data"][key].columns) != list(df.columns):
+                raise ValueError("Layers of %s in %s differ from those in %s" % (key, path, paths[0]))
+
+def _fill(arrays, shape):
+    """Copies arrays into consecutive rows of a single preallocated array."""
+    dtype = np.result_type(*[arr.dtype for arr in arrays])
+    res = np.empty(shape, dtype=dtype)
+    row = 0
+    for arr in arrays:
+        res[row:row + len(arr)] = arr
+        row += len(arr)
+    return res
+
+def _concat_models(paths, models, source_column="source_file"):
+    rows = [len(model["flightlines"]) for model in models]
+    nrows = sum(rows)
+    first = models[0]
+
+    columns = first["flightlines"].columns
+    flightlines = pd.DataFrame({
+        col: _fill([model["flightlines"][col].to_numpy() for model in models], nrows)
+        for col in columns}, columns=columns)
+    if source_column is not None:
+        flightlines[source_column] = pd.Categorical(
+            np.repeat(np.array(paths, dtype=object), rows), categories=list(dict.fromkeys(paths)))
+
+    layer_data = {}
+    for key, df in first["layer_data"].items():
+        dfs = [model["layer_data"][key] for model in models]
+        if len(set(dtype for layer_df in dfs for dtype in layer_df.dtypes)) == 1:
+            layer_data[key] = pd.DataFrame(
+                _fill([layer_df.to_numpy() for layer_df in dfs], (nrows, len(df.columns))),
+                columns=df.columns)
+        else:
+            # Mixed dtypes (e.g. integer and float layers) are kept per column
+            layer_data[key] = pd.DataFrame({
+                col: _fill([layer_df[col].to_numpy() for layer_df in dfs], nrows)
+                for col in df.columns}, columns=df.columns)
+
+    model_info = {}
+    for model in reversed(models):
+        model_info.update(model["model_info"])
+    model_info["source"] = list(paths)
+
+    res = {"flightlines": flightlines,
+           "layer_data": layer_data,
+           "model_info": model_info,
+           "file_meta": dict(first["file_meta"], sources=list(paths), rows=rows)}
+    if "alc_info" in first:
+        res["alc_info"] = first["alc_info"]
+    return res
+
+def parse_many(paths, workers=1, source_column="source_file", **kw):
+    """Parse several XYZ files with the same columns into a single
+    model dictionary, as returned by parse().
+
+    workers: number of processes to parse the files in (default 1).
+
+    source_column: name of a categorical flightlines column to record
+    the path of the file each row came from in, or None to not add
+    one.
+
+    The files must have the same flightlines columns and layer data,
+    or a ValueError is raised. The combined flightlines and layer data
+    are copied into arrays allocated once for the total number of
+    rows. file_meta["rows"] lists the number of rows of each file.
+
+    Any other arguments are passed to parse(), except that
+    dtype_policy is applied to the combined model.
+    """
+    paths = list(paths)
+    if not paths:
+        raise ValueError("No files to parse")
+    dtype_policy = kw.pop("dtype_policy", "default")
+    _check_dtype_policy(dtype_policy)
+    if workers > 1 and len(paths) > 1:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as executor:
+            models = list(executor.map(functools.partial(parse, **kw), paths))
+    else:
+        models = [parse(path, **kw) for path in paths]
+    _check_schemas(paths, models)
+    return apply_dtype_policy(_concat_models(paths, models, source_column), dtype_policy)
+
+def _read_stream_sample(inputfile, sample_size):
+    """Reads the header lines and at most sample_size characters of the
+    data section of a (decompressing) stream, without seeking or
+    reading any further. Returns them as a StringIO, and whether the
+    stream has more data after them."""
+    lines = []
+    for line in iter(inputfile.readline, ""):
+        lines.append(line)
+        if not line.startswith("/"):
+            # The first data line is part of the sample
+            lines.append(inputfile.read(max(sample_size - len(line), 0)))
+            break
+    return io.StringIO("".join(lines)), bool(inputfile.read(1))
+
+def _parse_header_only(inputfile, source=None, alcfile=None, size=None, sample_size=65536, truncated=False, **kw):
+    headers, col_names = _parse_header(inputfile)
+    _convert_header_values(headers)
+    headers["source"] = source
+
+    names, alcdata, _, (per_sounding_cols, colgroups) = _file_columns(col_names, alcfile)
+
+    data_start = inputfile.tell()
+    if size is None:
+        size = inputfile.seek(0, 2)
+        inputfile.seek(data_start)
+    sample = inputfile.read(sample_size)
+    rest = inputfile.read(1)
+    rows = sum(1 for line in sample.split("\n") if _is_data_line(line))
+    if truncated:
+        # The size of the data section of a compressed file is not known without decompressing all of it
+        rows = None
+    elif rest:
+        # Extrapolate from the sample. The last line of the sample is most likely incomplete, so don't count it.
+        rows = int(round(max(rows - 1, 1) * (size - data_start) / max(sample.rfind("\n"), 1)))
+
+    res = {"flightlines": per_sounding_cols,
+           "layer_data": {key: group_cols for key, (group_cols, layers) in colgroups.items()},
+           "model_info": headers,
+           "file_meta": {"columns": list(names),
+                         "rows": rows,
+                         "rows_estimated": bool(rest or truncated)}}
+    if alcdata is not None:
+        res["alc_info"] = alcdata["meta"]
+    return res
+
+def parse_header(nameorfile, sample_size=65536, **kw):
+    """Parse only the header of an XYZ file, without parsing any data.
+    Returns a dictionary with the same keys as parse(), but with
+    flightlines being a list of column names and layer_data a
+    dictionary of group name to list of column names.
+
+    file_meta["rows"] is the number of data rows. Unless the whole
+    data section fits in the first sample_size characters (in which
+    case file_meta["rows_estimated"] is False), this is an estimate
+    based on the file size and the line lengths in that sample.
+    Compressed files are only decompressed up to the end of that
+    sample, so if their data section is longer, file_meta["rows"] is
+    None.
+
+    alcfile: optional ALC file with column mappings, as for parse().
+    """
+    if isinstance(nameorfile, str):
+        with compression.open_file(nameorfile, 'r') as f:
+            if compression.detect(nameorfile) is None:
+                return _parse_header_only(f, source=nameorfile, size=os.path.getsize(nameorfile),
+                                          sample_size=sample_size, **kw)
+            sample, truncated = _read_stream_sample(f, sample_size)
+            return _parse_header_only(sample, source=nameorfile, sample_size=sample_size,
+                                      truncated=truncated, **kw)
+    else:
+        return _parse_header_only(nameorfile, sample_size=sample_size, **kw)
+
+def _line_id_column(columns):
+    columns_by_name = {col.lower(): col for col in reversed(list(columns))}
+    for name in _LINE_ID_COLUMNS:
+        if name in columns_by_name:
+            return columns_by_name[name]
+    return None
+
+def _line_starts(line_ids):
+    """Row positions where a new run of equal line ids starts."""
+    return np.concatenate([[0], np.flatnonzero(line_ids[1:] != line_ids[:-1]) + 1])
+
+def _model_rows(model, start, end):
+    """The rows start:end of a model dictionary, with its own copies
+    of model_info and file_meta."""
+    res = dict(model)
+    res["flightlines"] = model["flightlines"].iloc[start:end]
+    res["layer_data"] = {key: df.iloc[start:end] for key, df in model["layer_data"].items()}
+    res["model_info"] = copy.deepcopy(model["model_info"])
+    res["file_meta"] = dict(model["file_meta"])
+    return res
+
+def _parse_iter(inputfile, source=None, alcfile=None, engine="auto", chunksize=100000, by_line=False,
+                columns=None, layer_groups=None, nan_dummy=False, **kw):
+    headers, col_names = _parse_header(inputfile)
+    na_values = _na_values(headers, nan_dummy)
+    _convert_header_values(headers)
+    headers["source"] = source
+
+    names, alcdata, usecols, groups = _file_columns(col_names, alcfile, columns, layer_groups)
+
+    line_col = None
+    if by_line:
+        line_col = _line_id_column(names)
+        if line_col is None:
+            raise ValueError("No line id column found, can not split file by flight line")
+        if usecols is not None and names.get_loc(line_col) not in usecols:
+            usecols = sorted(usecols + [names.get_loc(line_col)])
+    read_names = names if usecols is None else names[usecols]
+
+    def make_model(full_df, engine):
+        return _make_model(full_df, copy.deepcopy(headers), {"engine": engine}, alcdata, groups)
+
+    offset = 0
+    rest = None
+    for full_df, engine in _read_data_chunks(inputfile, col_names, na_values, engine, chunksize, usecols=usecols):
+        full_df = _clean_data(full_df.set_axis(read_names, axis=1))
+        full_df.index += offset
+        offset += len(full_df)
+        
+        if line_col is None:
+            if len(full_df):
+                yield make_model(full_df, engine)
+            continue
+
+        if rest is not None:
+            full_df = pd.concat((rest, full_df))
+        if not len(full_df):
+            continue
+        # The last line might continue in the next chunk
+        starts = _line_starts(full_df[line_col].to_numpy())
+        rest = full_df.iloc[starts[-1]:]
+        if starts[-1] > 0:
+            model = make_model(full_df.iloc[:starts[-1]], engine)
+            for start, end in zip(starts[:-1], starts[1:]):
+                yield _model_rows(model, start, end)
+
+    if rest is not None and len(rest):
+        yield make_model(rest, engine)
+
+def parse_iter(nameorfile, chunksize=100000, by_line=False, **kw):
+    """Parse an XYZ file in chunks, yielding model dictionaries in
+    the same format as parse(), each with at most chunksize rows. The
+    header is only parsed once, and the grouping of layer columns is
+    shared between all chunks. Row indices continue from one chunk to
+    the next, so pd.concat() of the chunks gives the same rows as
+    parse().
+
+    by_line=True: instead yield one chunk per flight line. Rows
+    belonging to the same line must be consecutive in the file.
+
+    Any other arguments are the same as for parse().
+    """
+    if isinstance(nameorfile, str):
+        with compression.open_file(nameorfile, 'r') as f:
+            for chunk in _parse_iter(f, source=nameorfile, chunksize=chunksize, by_line=by_line, **kw):
+                yield chunk
+    else:
+        for chunk in _parse_iter(nameorfile, chunksize=chunksize, by_line=by_line, **kw):
+            yield chunk
+
+# Default number of values dump() formats at a time
+_DUMP_CHUNK_VALUES = 250000
+
+def _column_format(values, precision, name):
+    if values.dtype.kind not in "f":
+        return None
+    if isinstance(precision, dict):
+        precision = precision.get(name)
+    if precision is None:
+        return None
+    if isinstance(precision, str):
+        return precision
+    return "%%.%sg" % precision
+
+def _dump_columns(data, precision=None):
+    """Returns the column names, values (a rows x columns array) and %
+    format (None for full precision) of each block of columns to
+    write: one per flightlines column and one per layer_data group (or
+    per layer, for groups with several dtypes), without copying or
+    modifying data."""
+    res = []
+    for col in data["flightlines"].columns:
+        values = data["flightlines"][col].to_numpy()
+        res.append(([col], values[:, None], _column_format(values, precision, col)))
+    for key, df in data["layer_data"].items():
+        names = [key + '_' + "{:02d}".format(col+1) for col in df.columns]
+        if len(set(df.dtypes)) == 1:
+            values = df.to_numpy()
+            res.append((names, values, _column_format(values, precision, key)))
+        else:
+            for name, col in zip(names, df.columns):
+                values = df[col].to_numpy()
+                res.append(([name], values[:, None], _column_format(values, precision, key)))
+    return res
+
+def _quote(value):
+    if value is None or (pd.api.types.is_scalar(value) and pd.isna(value)):
+        return "*"
+    value = str(value)
+    if " " in value or '"' in value or "\n" in value:
+        return '"' + value.replace('"', '""') + '"'
+    return value
+
+def _text_values(column):
+    """The values of a non numeric column as DataFrame.to_csv() writes
+    them, e.g. datetimes as 2020-01-01 10:00:00."""
+    if column.dtype.kind in "mM":
+        na = pd.isna(column)
+        column = pd.Series(column).astype(str).to_numpy(dtype=object)
+        column[na] = None
+    return [_quote(value) for value in column.tolist()]
+
+def _format_block(values, fmt):
+    """Formats a rows x columns array, returning one string per row.
+    Numbers are converted by numpy, as in DataFrame.to_csv() (the
+    shortest repr, also for float32), with * for NaN."""
+    if values.dtype.kind not in "biuf":
+        columns = [_text_values(values[:, idx]) for idx in range(values.shape[1])]
+        return columns[0] if len(columns) == 1 else [" ".join(row) for row in zip(*columns)]
+    text = values.astype(str) if fmt is None else np.char.mod(fmt, values)
+    if values.dtype.kind == "f":
+        nans = np.isnan(values)
+        if nans.any():
+            text[nans] = "*"
+    if text.shape[1] == 1:
+        return text[:, 0].tolist()
+    return [" ".join(row) for row in text.tolist()]
+
+def _format_rows(columns, start, end):
+    blocks = [_format_block(values[start:end], fmt) for names, values, fmt in columns]
+    return "".join([" ".join(row) + "\n" for row in zip(*blocks)])
+
+def _dump(data, file, alcfile=None, precision=None, chunksize=None):
+    columns = _dump_columns(data, precision)
+    names = [name for block_names, values, fmt in columns for name in block_names]
     for key, value in data['model_info'].items():
         if key != 'source':
             file.write(b"/" + str(key).encode('utf-8') + b"\n")
@@ -228,18 +1259,39 @@ def _dump(data, file, alcfile=None):
                 file.write(b"/" + b' '.join(str(item).encode('utf-8') for item in value) + b"\n")
             else:
                 file.write(b"/" + str(value).encode('utf-8') + b"\n")
-    file.write(b'/ ')
-    df.to_csv(file, index=False, sep=' ', na_rep="*", encoding='utf-8')
+    file.write(b'/ ' + " ".join(names).encode('utf-8') + b"\n")
+    nrows = len(data["flightlines"])
+    if chunksize is None:
+        chunksize = max(1, _DUMP_CHUNK_VALUES // max(1, len(names)))
+    for start in range(0, nrows, chunksize):
+        file.write(_format_rows(columns, start, min(start + chunksize, nrows)).encode('utf-8'))
 
     if alcfile is not None:
-        alc.dump(data, alcfile, columns=df.columns)
+        alc.dump(data, alcfile, columns=pd.Index(names))
 
-def dump(data_in, nameorfile, **kw):
-    data = copy.deepcopy(data_in)
-    if isinstance(nameorfile, str):
-        with open(nameorfile, 'wb') as f:
-            return _dump(data, f, **kw)
-    else:
-        return _dump(data, nameorfile, **kw)
+def dump(data, nameorfile, **kw):
+    """Write a model dictionary, as returned by parse(), to an XYZ
+    file. data is not modified or copied; rows are formatted a block
+    of columns at a time and written chunksize rows at a time (by
+    default as many rows as hold about 250000 values).
+
+    nameorfile: either a file path as a string, or a file object
+    opened in binary mode.
+
+    alcfile: optional file path or open file object to write an
+    Aarhus Workbench style ALC file with column mappings to.
+
+    precision: number of significant digits of float columns, or a %
+    format string such as "%.2f". Can also be a dictionary from
+    flightlines column names and layer_data keys to either of those,
+    in which case columns not listed are written with full precision.
+    Default is full (round trip) precision.
+    """
+    with profiling.stage("export.xyz", rows=len(data["flightlines"])):
+        if isinstance(nameorfile, str):
+            with compression.open_file(nameorfile, 'wb') as f:
+                return _dump(data, f, **kw)
+        else:
+            return _dump(data, nameorfile, **kw)
 
 
@@ -24,5 +24,6 @@ setuptools.setup(
     extras_require={
         'normalisation': ["pryproj", "projnames"],
         'tests': ['nose2', 'downfile'],
+        'zstd': ['zstandard'],
     }
 )
@@ -0,0 +1,33 @@
+import unittest
+import libaarhusxyz
+import libaarhusxyz.cache
+import os.path
+import pandas as pd
+from utils import test_sci_inv_6602, test_raw_6602, test_avg_6602, TempDir
+
+class TestCache(unittest.TestCase):
+    def test_cache(self):
+        path = test_sci_inv_6602
+        full = libaarhusxyz.parse(path)
+        with TempDir() as tmpdir:
+            before = libaarhusxyz.cache.stats()
+            self.assertEqual(libaarhusxyz.parse(path, cache_dir=tmpdir.name)["file_meta"]["cache"], "miss")
+            cached = libaarhusxyz.XYZ(path, cache_dir=tmpdir.name).model_dict
+            self.assertEqual(cached["file_meta"]["cache"], "hit")
+            pd.testing.assert_frame_equal(cached["flightlines"], full["flightlines"])
+            for key, df in full["layer_data"].items():
+                pd.testing.assert_frame_equal(cached["layer_data"][key], df)
+            self.assertEqual(cached["model_info"], full["model_info"])
+            self.assertEqual(libaarhusxyz.parse(path, cache_dir=tmpdir.name, layer_groups=["rho_i"])["file_meta"]["cache"], "miss")
+            after = libaarhusxyz.cache.stats()
+            self.assertEqual(after["hits"] - before["hits"], 1)
+            self.assertEqual(after["misses"] - before["misses"], 2)
+
+            libaarhusxyz.parse(path, cache_dir=tmpdir.name, columns=["utmx"], cache_size=0)
+            self.assertEqual(os.listdir(tmpdir.name), [])
+
+    def test_parse_many(self):
+        paths = [test_raw_6602, test_avg_6602]
+        with TempDir() as tmpdir:
+            libaarhusxyz.XYZ(paths, cache_dir=tmpdir.name)
+            self.assertEqual(libaarhusxyz.XYZ(paths, cache_dir=tmpdir.name).file_meta["cache"], "hit")
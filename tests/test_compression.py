@@ -0,0 +1,55 @@
+import unittest
+import libaarhusxyz
+import libaarhusxyz.compression
+import numpy as np
+import pandas as pd
+from utils import test_sci_inv_6602, TempDir
+
+class TestCompression(unittest.TestCase):
+    def test_roundtrip(self):
+        full = libaarhusxyz.parse(test_sci_inv_6602)
+        with TempDir() as tmpdir:
+            libaarhusxyz.dump(full, tmpdir.path("plain.xyz"))
+            expected = libaarhusxyz.parse(tmpdir.path("plain.xyz"))
+            for ext, codec in ((".gz", "gzip"), (".bz2", "bz2"), (".xz", "xz")):
+                compressed = tmpdir.path("compressed.xyz" + ext)
+                libaarhusxyz.dump(full, compressed)
+                self.assertEqual(libaarhusxyz.compression.detect(compressed), codec)
+                parsed = libaarhusxyz.XYZ(compressed).model_dict
+                pd.testing.assert_frame_equal(parsed["flightlines"], expected["flightlines"])
+                for key, df in expected["layer_data"].items():
+                    pd.testing.assert_frame_equal(parsed["layer_data"][key], df)
+
+    def assertHeader(self, ext):
+        data = "/ line x rho_1 rho_2 rho_3\n" + "".join(" 100 %s 1 2 3\n" % (x % 10) for x in range(1000))
+        with TempDir() as tmpdir:
+            path = tmpdir.path("header.xyz" + ext)
+            with libaarhusxyz.compression.open_file(path, "w") as f:
+                f.write(data)
+            header = libaarhusxyz.parse_header(path)
+            self.assertEqual(header["flightlines"], ["line", "x"])
+            self.assertEqual(header["file_meta"]["rows"], 1000)
+            self.assertFalse(header["file_meta"]["rows_estimated"])
+
+            header = libaarhusxyz.parse_header(path, sample_size=100)
+            self.assertEqual(list(header["layer_data"].keys()), ["rho"])
+            self.assertIsNone(header["file_meta"]["rows"])
+            self.assertTrue(header["file_meta"]["rows_estimated"])
+
+            # Only the start of the file is decompressed, so trailing garbage is never read
+            with libaarhusxyz.compression.open_file(path, "w") as f:
+                f.write(data.split("\n")[0] + "\n")
+                f.writelines(" 100 %r 1 2 3\n" % x for x in np.random.RandomState(0).random_sample(20000))
+            with open(path, "ab") as f:
+                f.write(b"garbage")
+            header = libaarhusxyz.parse_header(path)
+            self.assertEqual(header["flightlines"], ["line", "x"])
+            self.assertIsNone(header["file_meta"]["rows"])
+
+    def test_header(self):
+        for ext in (".gz", ".bz2", ".xz"):
+            self.assertHeader(ext)
+
+    @unittest.skipIf(libaarhusxyz.compression.zstandard is None, "zstandard is not installed")
+    def test_header_zstd(self):
+        self.assertHeader(".zst")
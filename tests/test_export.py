@@ -2,9 +2,13 @@ import unittest
 import libaarhusxyz
 import libaarhusxyz.export.geojson
 import libaarhusxyz.export.msgpack
+import libaarhusxyz.export.arrow
+import libaarhusxyz.export.npy
 import io
 import json
 import msgpack
+import numpy as np
+import pandas as pd
 from utils import *
 
 class TestExports(unittest.TestCase):
@@ -24,5 +28,90 @@ class TestExports(unittest.TestCase):
         f.seek(0)
         data = msgpack.load(f, strict_map_key=False)
         assert (data["flightlines"]["x"] == xyz.flightlines.x).min()
-        
-        
+
+    def test_export_parquet(self):
+        xyz = libaarhusxyz.XYZ(test_sci_inv_6602)
+        for dump, load in ((libaarhusxyz.export.arrow.dump_parquet, libaarhusxyz.XYZ.from_parquet),
+                           (libaarhusxyz.export.arrow.dump_feather, libaarhusxyz.XYZ.from_feather)):
+            f = io.BytesIO()
+            dump(xyz, f)
+            f.seek(0)
+            loaded = load(f)
+            pd.testing.assert_frame_equal(loaded.flightlines, xyz.flightlines)
+            for key, df in xyz.layer_data.items():
+                pd.testing.assert_frame_equal(loaded.layer_data[key], df)
+            assert loaded.model_info == xyz.model_info
+            f.seek(0)
+            loaded = load(f, columns=["utmx", "utmy"], layer_groups=["rho_i"])
+            assert list(loaded.flightlines.columns) == ["utmx", "utmy"]
+            assert list(loaded.layer_data.keys()) == ["rho_i"]
+
+    def test_export_npy(self):
+        xyz = libaarhusxyz.XYZ(test_sci_inv_6602)
+        with TempDir() as tmpdir:
+            xyz.to_npy(tmpdir.name)
+            loaded = libaarhusxyz.XYZ.open(tmpdir.name)
+            pd.testing.assert_frame_equal(loaded.flightlines, xyz.flightlines)
+            for key, df in xyz.layer_data.items():
+                pd.testing.assert_frame_equal(loaded.layer_data[key], df)
+            assert loaded.model_info == xyz.model_info
+            rho = loaded.layer_data["rho_i"]._mgr.blocks[0].values
+            while not isinstance(rho, np.memmap):
+                rho = rho.base
+            loaded = libaarhusxyz.XYZ.open(tmpdir.name, mmap=False, columns=["utmx"], layer_groups=["rho_i"])
+            assert list(loaded.flightlines.columns) == ["utmx"]
+            assert list(loaded.layer_data.keys()) == ["rho_i"]
+
+class TestDump(unittest.TestCase):
+    def assertDumpsAsCsv(self, model):
+        """The data lines must be what DataFrame.to_csv() wrote before
+        dump() formatted the rows itself."""
+        frame = pd.concat([model["flightlines"]] + [
+            df.rename(columns=lambda col: "%s_%02d" % (key, col + 1))
+            for key, df in model["layer_data"].items()], axis=1)
+        f = io.BytesIO()
+        libaarhusxyz.dump(model, f, chunksize=7)
+        self.assertTrue(f.getvalue().decode("utf-8").endswith(
+            "/ " + frame.to_csv(sep=" ", na_rep="*", index=False, lineterminator="\n")))
+
+    def test_compact_as_csv(self):
+        path = test_sci_inv_6602
+        model = libaarhusxyz.parse(path, dtype_policy="compact")
+        self.assertEqual(model["layer_data"]["rho_i"].dtypes.iloc[0], np.float32)
+        self.assertDumpsAsCsv(model)
+
+    def test_datetime_as_csv(self):
+        path = test_sci_inv_6602
+        model = libaarhusxyz.parse(path)
+        nrows = len(model["flightlines"])
+        model["flightlines"]["time"] = pd.to_datetime(["2020-01-01 10:00:00"] * (nrows - 1) + [None])
+        model["flightlines"]["duration"] = pd.to_timedelta(["00:10:00"] * nrows)
+        model["flightlines"]["label"] = pd.array(["a b"] * (nrows - 1) + [pd.NA], dtype="string")
+        model["flightlines"]["count"] = pd.array([1] * (nrows - 1) + [pd.NA], dtype="Int64")
+        self.assertDumpsAsCsv(model)
+
+    def test_roundtrip(self):
+        path = test_sci_inv_6602
+        model = libaarhusxyz.parse(path)
+        layer_columns = {key: list(df.columns) for key, df in model["layer_data"].items()}
+        f = io.BytesIO()
+        libaarhusxyz.dump(model, f)
+        self.assertEqual({key: list(df.columns) for key, df in model["layer_data"].items()}, layer_columns)
+        f.seek(0)
+        parsed = libaarhusxyz.parse(io.TextIOWrapper(f))
+        pd.testing.assert_frame_equal(parsed["flightlines"], model["flightlines"])
+        for key, df in model["layer_data"].items():
+            pd.testing.assert_frame_equal(parsed["layer_data"][key], df)
+
+    def test_precision(self):
+        path = test_sci_inv_6602
+        model = libaarhusxyz.parse(path)
+        full = io.BytesIO()
+        libaarhusxyz.dump(model, full)
+        short = io.BytesIO()
+        libaarhusxyz.dump(model, short, precision={"rho_i": 3, "utmx": "%.1f"})
+        self.assertLess(len(short.getvalue()), len(full.getvalue()))
+        short.seek(0)
+        parsed = libaarhusxyz.parse(io.TextIOWrapper(short))
+        np.testing.assert_allclose(parsed["layer_data"]["rho_i"].values, model["layer_data"]["rho_i"].values, rtol=5e-3)
+        np.testing.assert_allclose(parsed["flightlines"]["utmx"].values, model["flightlines"]["utmx"].values, atol=0.05)
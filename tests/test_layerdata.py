@@ -0,0 +1,65 @@
+import unittest
+import libaarhusxyz
+import libaarhusxyz.layerdata
+import numpy as np
+import pandas as pd
+from utils import test_sci_inv_6602, TempDir
+
+class TestLayerBlocks(unittest.TestCase):
+    def assertModelEqual(self, a, b):
+        pd.testing.assert_frame_equal(a.flightlines, b.flightlines)
+        self.assertEqual(set(a.layer_data.keys()), set(b.layer_data.keys()))
+        for key, df in a.layer_data.items():
+            pd.testing.assert_frame_equal(b.layer_data[key], df)
+
+    def test_layer_blocks(self):
+        path = test_sci_inv_6602
+        plain = libaarhusxyz.XYZ(path)
+        blocks = libaarhusxyz.XYZ(path, layer_blocks=True)
+        self.assertIsInstance(blocks.layer_data, libaarhusxyz.layerdata.LayerData)
+        self.assertModelEqual(plain, blocks)
+
+        blocks.layer_data["rho_i"].iloc[1, 2] = 42.0
+        self.assertEqual(blocks.layer_data.take([1])["rho_i"].iloc[0, 2], 42.0)
+        blocks.layer_data["rho_i"] = plain.layer_data["rho_i"]
+
+        plain_lines = plain.split_by_line()
+        block_lines = blocks.split_by_line()
+        for line, xyz in plain_lines.items():
+            self.assertModelEqual(xyz, block_lines[line])
+        joined = libaarhusxyz.XYZ(*block_lines.values())
+        self.assertIsInstance(joined.layer_data, libaarhusxyz.layerdata.LayerData)
+        self.assertModelEqual(libaarhusxyz.XYZ(*plain_lines.values()), joined)
+
+    def test_unaligned_frames(self):
+        index = pd.Index([10, 11, 12, 13])
+        rho = pd.DataFrame(np.arange(8.0).reshape(4, 2), index=index)
+        # Stored next to the blocks, as the index differs
+        text = pd.DataFrame({0: ["row%s" % label for label in index[::-1]]}, index=index[::-1])
+        layer_data = libaarhusxyz.layerdata.LayerData({"rho": rho, "text": text})
+        taken = layer_data.take([1, 3])
+        pd.testing.assert_frame_equal(taken["rho"], rho.iloc[[1, 3]])
+        self.assertEqual(list(taken["text"][0]), ["row11", "row13"])
+        self.assertEqual(list(taken["text"].index), [11, 13])
+        self.assertEqual(list(layer_data.reindex([13, 10])["text"][0]), ["row13", "row10"])
+        self.assertEqual(list(libaarhusxyz.layerdata.take(layer_data, [0])["text"][0]), ["row10"])
+
+class TestLazy(unittest.TestCase):
+    def test_lazy(self):
+        path = test_sci_inv_6602
+        full = libaarhusxyz.XYZ(path)
+        lazy = libaarhusxyz.XYZ(path, lazy=True)
+        pd.testing.assert_frame_equal(lazy.flightlines, full.flightlines)
+        self.assertEqual(list(lazy.layer_data.keys()), list(full.layer_data.keys()))
+        self.assertEqual(lazy.layer_data.loaded, [])
+        pd.testing.assert_frame_equal(lazy.rho_i, full.rho_i)
+        self.assertEqual(lazy.layer_data.loaded, ["rho_i"])
+        for key, df in full.layer_data.items():
+            pd.testing.assert_frame_equal(lazy.layer_data[key], df)
+
+        with TempDir() as tmpdir:
+            full.to_npy(tmpdir.name)
+            lazy = libaarhusxyz.XYZ.open(tmpdir.name, lazy=True, layer_groups=["rho_i", "thk"])
+            self.assertEqual(list(lazy.layer_data.keys()), ["rho_i", "thk"])
+            pd.testing.assert_frame_equal(lazy.layer_data["thk"], full.layer_data["thk"])
+            self.assertEqual(lazy.layer_data.loaded, ["thk"])
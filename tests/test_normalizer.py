@@ -0,0 +1,133 @@
+import unittest
+import unittest.mock
+import libaarhusxyz
+import libaarhusxyz.normalizer
+import numpy as np
+import pandas as pd
+from utils import test_sci_inv_6602
+
+class TestNameMapper(unittest.TestCase):
+    def test_cached(self):
+        mapper = libaarhusxyz.normalizer.get_name_mapper()
+        self.assertIs(libaarhusxyz.normalizer.get_name_mapper(), mapper)
+        self.assertEqual(mapper("UTMX"), "x")
+        extra = libaarhusxyz.normalizer.get_name_mapper(extra_mappings={"Res": "resistivity"})
+        self.assertIsNot(extra, mapper)
+        self.assertIs(libaarhusxyz.normalizer.get_name_mapper(extra_mappings={"Res": "resistivity"}), extra)
+        self.assertEqual(extra("Res"), "resistivity")
+        self.assertEqual(mapper("Res"), "Res")
+
+    def test_unhashable_extra_mappings(self):
+        extra = libaarhusxyz.normalizer.get_name_mapper(extra_mappings={"Res": "resistivity", "Alt": ["altitude"]})
+        self.assertIs(libaarhusxyz.normalizer.get_name_mapper(extra_mappings={"Alt": ["altitude"], "Res": "resistivity"}), extra)
+        self.assertEqual(extra("Res"), "resistivity")
+
+    def test_name_patterns(self):
+        for name, expected in (("e_foo_utm", "utmx"), ("n_utm", "utmy"), ("E_utm", "E_utm"), ("dbdt_ch1gt", "dbdt_ch1gt")):
+            self.assertEqual(libaarhusxyz.normalizer.map_name_pattern(name), expected)
+
+class TestProjection(unittest.TestCase):
+    def test_project_many(self):
+        x = np.linspace(400000, 600000, 1000)
+        y = np.linspace(6000000, 7000000, 1000)
+        expected = [libaarhusxyz.normalizer.project(32632, crs, x, y) for crs in (3857, 4326)]
+        chunked = libaarhusxyz.normalizer.project_many(32632, [3857, 4326], x, y, workers=2, chunksize=128)
+        for (ex, ey), (cx, cy) in zip(expected, chunked):
+            np.testing.assert_array_equal(cx, ex)
+            np.testing.assert_array_equal(cy, ey)
+        self.assertIs(libaarhusxyz.normalizer.get_transformer(32632, 4326),
+                      libaarhusxyz.normalizer.get_transformer(32632, 4326))
+
+    def test_reuse_transformers(self):
+        x = np.linspace(400000, 600000, 1000)
+        y = np.linspace(6000000, 7000000, 1000)
+        libaarhusxyz.normalizer.project_many(32632, [3857], x, y, workers=2, chunksize=128)
+        from_crs = libaarhusxyz.normalizer.pyproj.Transformer.from_crs
+        with unittest.mock.patch.object(libaarhusxyz.normalizer.pyproj.Transformer, "from_crs",
+                                        side_effect=from_crs) as created:
+            libaarhusxyz.normalizer.project_many(32632, [3857], x, y, workers=2, chunksize=128)
+        self.assertEqual(created.call_count, 0)
+
+class TestDates(unittest.TestCase):
+    def test_parse_datetimes(self):
+        dates = np.array(["2021-09-16", "2021-09-16", "", "2021-12-31"], dtype=object)
+        times = np.array(["09:53:52.000", "24:00:01.500", "10:00:00.000", "24:10:00.000"], dtype=object)
+        parsed = libaarhusxyz.normalizer.parse_datetimes(dates, times)
+        self.assertEqual(parsed[0], pd.Timestamp("2021-09-16 09:53:52"))
+        self.assertEqual(parsed[1], pd.Timestamp("2021-09-17 00:00:01.5"))
+        self.assertTrue(pd.isna(parsed[2]))
+        self.assertEqual(parsed[3], pd.Timestamp("2022-01-01 00:10:00"))
+        parsed = libaarhusxyz.normalizer.parse_datetimes(
+            np.array(["16/09/2021"], dtype=object), np.array(["24:10"], dtype=object),
+            date_format="%d/%m/%Y", time_format="%H:%M")
+        self.assertEqual(parsed[0], pd.Timestamp("2021-09-17 00:10:00"))
+
+    def test_parse_other_times(self):
+        dates = np.array(["2021-09-16", "2021-09-16"], dtype=object)
+        parsed = libaarhusxyz.normalizer.parse_datetimes(dates, np.array(["09:53:52 PM", "09:53:52 AM"], dtype=object))
+        self.assertEqual(parsed[0], pd.Timestamp("2021-09-16 21:53:52"))
+        self.assertEqual(parsed[1], pd.Timestamp("2021-09-16 09:53:52"))
+        parsed = libaarhusxyz.normalizer.parse_datetimes(dates, np.array(["095352", "101010"], dtype=object))
+        self.assertEqual(parsed[0], pd.Timestamp("2021-09-16 09:53:52"))
+        self.assertEqual(parsed[1], pd.Timestamp("2021-09-16 10:10:10"))
+
+class TestIncrementalNormalize(unittest.TestCase):
+    def test_renormalize(self):
+        path = test_sci_inv_6602
+        xyz = libaarhusxyz.XYZ(path, normalize=True)
+        xyz.normalize()
+        self.assertEqual(xyz._normalization["last_run"], [])
+        x = xyz.flightlines["x"].copy()
+        x[1] += 10
+        xyz.flightlines["x"] = x
+        xyz.normalize()
+        self.assertEqual(xyz._normalization["last_run"], ["coordinates", "xdist"])
+
+    def test_noop(self):
+        path = test_sci_inv_6602
+        xyz = libaarhusxyz.XYZ(path, normalize=True)
+        with libaarhusxyz.profiling.profile(memory=False) as report:
+            xyz.normalize()
+            xyz.ensure("xdist", "z_top")
+        self.assertEqual([stage["stage"] for stage in report], ["normalize", "normalize"])
+        self.assertEqual(xyz._normalization["last_run"], [])
+
+    def test_removed_output(self):
+        path = test_sci_inv_6602
+        xyz = libaarhusxyz.XYZ(path, normalize=True)
+        xdist = xyz.flightlines["xdist"].copy()
+        z_top = xyz.layer_data["z_top"].copy()
+        del xyz.flightlines["xdist"]
+        xyz.ensure("xdist")
+        pd.testing.assert_series_equal(xyz.flightlines["xdist"], xdist)
+        del xyz.flightlines["xdist"]
+        del xyz.layer_data["z_top"]
+        xyz.normalize()
+        self.assertIn("xdist", xyz._normalization["last_run"])
+        self.assertIn("z", xyz._normalization["last_run"])
+        pd.testing.assert_series_equal(xyz.flightlines["xdist"], xdist)
+        pd.testing.assert_frame_equal(xyz.layer_data["z_top"], z_top)
+        del xyz.layer_data["z_top"]
+        xyz.ensure("z_top")
+        pd.testing.assert_frame_equal(xyz.layer_data["z_top"], z_top)
+
+    def test_force(self):
+        path = test_sci_inv_6602
+        xyz = libaarhusxyz.XYZ(path)
+        xyz.normalize(nan_value=9999)
+        xyz.layer_data["resistivity"].iloc[0, 0] = 9999
+        xyz.normalize(nan_value=9999)
+        self.assertEqual(xyz._normalization["last_run"], [])
+        xyz.normalize(nan_value=9999, force=True)
+        self.assertIn("nans", xyz._normalization["last_run"])
+        self.assertTrue(np.isnan(xyz.layer_data["resistivity"].iloc[0, 0]))
+
+    def test_lazy(self):
+        path = test_sci_inv_6602
+        full = libaarhusxyz.XYZ(path, normalize=True)
+        lazy = libaarhusxyz.XYZ(path, normalize="lazy")
+        self.assertNotIn("z_top", lazy.layer_data)
+        pd.testing.assert_frame_equal(lazy.z_top, full.z_top)
+        self.assertNotIn("xdist", lazy.flightlines.columns)
+        lazy.ensure("xdist")
+        pd.testing.assert_series_equal(lazy.flightlines["xdist"], full.flightlines["xdist"])
@@ -6,8 +6,8 @@ import os.path
 import pandas as pd
 import numpy as np
 import copy
+import io
 from utils import *
-
 class TestAarhusWorkbenchVersion(unittest.TestCase):
     metadata_raw = {'model_info': {'data unit', 'number of gates for channel 2', 'number of gates for channel 1', 'gate times for channel 1', 'dummy', 'info', 'data type', 'source', 'inversion_type', 'gate times for channel 2', 'workspace name', 'wb version', 'coordinate system', 'node name(s)', 'projection'},
                     'flightlines': {'lon', 'title', 'fieldpolarity', 'numgates', 'rx_altitude_std', 'x', 'restotal', 'x_orig', 'lat', 'current', 'timestamp', 'y', 'y_orig', 'x_web', 'tx_altitude', 'resdata', 'channel_no', 'doi_lower', 'doi_upper', 'tx_area', 'y_web', 'tilt_x_std', 'numdata', 'rx_altitude', 'tilt_y_std', 'tx_altitude_std', 'topo', 'tilt_y', 'xdist', 'tilt_x'},
@@ -70,7 +70,6 @@ class TestAarhusWorkbenchVersion(unittest.TestCase):
         self.assertEqual(wb6_ld - wbtest_ld, set())
         self.assertEqual(wbtest_ld - wb6_ld, set())
 
-
 class TestAarhusWorkbench5940(TestAarhusWorkbenchVersion):
     metadata_avg = copy.deepcopy(TestAarhusWorkbenchVersion.metadata_avg)
     metadata_avg["layer_data"] = metadata_avg["layer_data"] - {'dbdt_inuse_ch1gt', 'dbdt_inuse_ch2gt'}
@@ -113,7 +112,6 @@ class TestAarhusWorkbench5940(TestAarhusWorkbenchVersion):
                 libaarhusxyz.XYZ(os.path.join(test_datadir_wb_5940, "pro_MOD_syn.xyz"), normalize=True)),
             self.metadata_syn)
 
-
 class TestAarhusWorkbench6011(TestAarhusWorkbenchVersion):
     metadata_dat = copy.deepcopy(TestAarhusWorkbenchVersion.metadata_dat)
     metadata_dat["model_info"] = metadata_dat["model_info"] - {'model unit', 'length unit'}
@@ -147,7 +145,6 @@ class TestAarhusWorkbench6011(TestAarhusWorkbenchVersion):
                 libaarhusxyz.XYZ(os.path.join(test_datadir_wb_6011, "MOD_syn.xyz"), normalize=True)),
             self.metadata_syn)
 
-
 class TestAarhusWorkbench6100(TestAarhusWorkbenchVersion):
     metadata_avg = copy.deepcopy(TestAarhusWorkbenchVersion.metadata_avg)
     metadata_avg["model_info"] = metadata_avg["model_info"] - {'gate times for channel 2', 'number of gates for channel 2'}
@@ -192,6 +189,7 @@ class TestAarhusWorkbench6100(TestAarhusWorkbenchVersion):
             self.metadata_syn)
 
         
+
 class TestAarhusWorkbench6210(TestAarhusWorkbenchVersion):
     metadata_avg = copy.deepcopy(TestAarhusWorkbenchVersion.metadata_avg)
     metadata_avg["model_info"] = metadata_avg["model_info"] - {'gate times for channel 2', 'number of gates for channel 2'}
@@ -243,6 +241,229 @@ class TestAarhusWorkbench6700(TestAarhusWorkbenchVersion):
         self.assertDeepSupersetOf(
             self.extract_metadata(
                 libaarhusxyz.XYZ(os.path.join(test_datadir_wb_6700, "SCI_1_Pro3_MOD_syn_example_SCI_inversion_export.xyz"), normalize=True)),
-            self.metadata_syn)        
-
+            self.metadata_syn)
 
+class TestParserEngines(unittest.TestCase):
+    def assertModelsEqual(self, a, b):
+        pd.testing.assert_frame_equal(a["flightlines"], b["flightlines"])
+        self.assertEqual(set(a["layer_data"].keys()), set(b["layer_data"].keys()))
+        for key in a["layer_data"].keys():
+            pd.testing.assert_frame_equal(a["layer_data"][key], b["layer_data"][key])
+
+    def test_c_engine(self):
+        path = test_sci_inv_6602
+        fast = libaarhusxyz.parse(path)
+        slow = libaarhusxyz.parse(path, engine="python")
+        self.assertEqual(fast["file_meta"]["engine"], "c")
+        self.assertEqual(slow["file_meta"]["engine"], "python")
+        self.assertModelsEqual(fast, slow)
+
+    def test_c_engine_trailing_commas(self):
+        # The rows of these files end with a comma
+        for name in ("AVG_export_example_averagde_data_export.xyz", "RAW_export_example_raw_data_export.xyz"):
+            path = os.path.join(test_datadir_wb_6700, name)
+            self.assertModelsEqual(libaarhusxyz.parse(path), libaarhusxyz.parse(path, engine="python"))
+
+    def test_separators(self):
+        data = "/DUMMY\n/9999\n/ a b c\nLine 1\n 1, 2, 3,\n/ comment\n 4 5 *\nTie 7\n 6 7 8\n"
+        parsed = libaarhusxyz.parse(io.StringIO(data))
+        self.assertEqual(parsed["file_meta"]["engine"], "c")
+        self.assertEqual(list(parsed["flightlines"]["a"]), [1, 4, 6])
+        self.assertEqual(parsed["flightlines"]["c"][0], 3)
+        self.assertTrue(np.isnan(parsed["flightlines"]["c"][1]))
+
+
+    def test_mmap_engine(self):
+        path = test_sci_inv_6602
+        parsed = libaarhusxyz.parse(path, engine="mmap")
+        self.assertEqual(parsed["file_meta"]["engine"], "mmap")
+        self.assertModelsEqual(parsed, libaarhusxyz.parse(path))
+
+        parsed = libaarhusxyz.parse(path, engine="mmap", float_dtype=np.float32)
+        self.assertEqual(parsed["layer_data"]["rho_i"].values.dtype, np.float32)
+
+    def test_mmap_engine_line_separator(self):
+        path = test_sci_inv_6602
+        with open(path) as f:
+            lines = f.readlines()
+        data_start = next(idx for idx, line in enumerate(lines) if not line.startswith("/"))
+        with TempDir() as tmpdir:
+            separated = tmpdir.write("separated.xyz", "".join(
+                lines[:data_start] + ["\n", "Line 100101\n"] + lines[data_start:]))
+            parsed = libaarhusxyz.parse(separated, engine="mmap")
+            self.assertEqual(parsed["file_meta"]["engine"], "mmap")
+            self.assertModelsEqual(parsed, libaarhusxyz.parse(path))
+
+    def test_mmap_engine_line_separator_inf(self):
+        with TempDir() as tmpdir:
+            path = tmpdir.write("inf.xyz", "/ a b\nLine 1\n1 2\ninf 3\nInf 4\nnan 5\n/ comment\nTie 2\n-inf 6\n")
+            parsed = libaarhusxyz.parse(path, engine="mmap")
+            self.assertEqual(parsed["file_meta"]["engine"], "mmap")
+            np.testing.assert_array_equal(parsed["flightlines"]["a"], [1, np.inf, np.inf, np.nan, -np.inf])
+            np.testing.assert_array_equal(parsed["flightlines"]["b"], [2, 3, 4, 5, 6])
+
+    def test_mmap_engine_fallback(self):
+        path = os.path.join(test_datadir_skytem, "2022.02.test.xyz")
+        parsed = libaarhusxyz.parse(path, engine="mmap")
+        self.assertEqual(parsed["file_meta"]["engine"], "c")
+
+
+    def test_projection(self):
+        path = test_sci_inv_6602
+        full = libaarhusxyz.parse(path)
+        for engine in ("auto", "python", "mmap"):
+            parsed = libaarhusxyz.parse(path, engine=engine, columns=["utmx", "utmy"], layer_groups=["rho_i", "dep_bot"])
+            self.assertEqual(list(parsed["flightlines"].columns), ["utmx", "utmy"])
+            self.assertEqual(set(parsed["layer_data"].keys()), {"rho_i", "dep_bot"})
+            pd.testing.assert_frame_equal(parsed["flightlines"], full["flightlines"][["utmx", "utmy"]])
+            pd.testing.assert_frame_equal(parsed["layer_data"]["rho_i"], full["layer_data"]["rho_i"])
+        with self.assertRaises(ValueError):
+            libaarhusxyz.parse(path, layer_groups=["nonexistent"])
+
+    def test_projection_missing_trailing_column(self):
+        # The data rows of this file have one field less than its header
+        path = os.path.join(test_datadir_wb_6700, "RAW_export_example_raw_data_export.xyz")
+        full = libaarhusxyz.parse(path)
+        parsed = libaarhusxyz.parse(path, columns=["utmx"])
+        pd.testing.assert_frame_equal(parsed["flightlines"], full["flightlines"][["utmx"]])
+        for key, df in full["layer_data"].items():
+            pd.testing.assert_frame_equal(parsed["layer_data"][key], df)
+
+    def test_workers(self):
+        path = test_sci_inv_6602
+        self.assertModelsEqual(libaarhusxyz.parse(path, workers=3), libaarhusxyz.parse(path))
+
+class TestParseIter(unittest.TestCase):
+    path = test_raw_6602
+
+    def test_chunks(self):
+        full = libaarhusxyz.parse(self.path)
+        chunks = list(libaarhusxyz.parse_iter(self.path, chunksize=2))
+        self.assertEqual(len(chunks), int(np.ceil(len(full["flightlines"]) / 2)))
+        pd.testing.assert_frame_equal(pd.concat([chunk["flightlines"] for chunk in chunks]), full["flightlines"])
+        for key, layer_df in full["layer_data"].items():
+            pd.testing.assert_frame_equal(pd.concat([chunk["layer_data"][key] for chunk in chunks]), layer_df)
+
+    def test_by_line(self):
+        data = "/ line x rho_1 rho_2 rho_3\n" + "".join(
+            " %s %s 1 2 3\n" % (line, x) for line in (100, 200, 300) for x in range(5))
+        chunks = list(libaarhusxyz.parse_iter(io.StringIO(data), chunksize=3, by_line=True))
+        self.assertEqual([list(chunk["flightlines"]["line"].unique()) for chunk in chunks], [[100], [200], [300]])
+        self.assertEqual([len(chunk["layer_data"]["rho"]) for chunk in chunks], [5, 5, 5])
+        # Several lines per chunk
+        full = libaarhusxyz.parse(io.StringIO(data))
+        chunks = list(libaarhusxyz.parse_iter(io.StringIO(data), chunksize=8, by_line=True))
+        self.assertEqual([list(chunk["flightlines"]["line"].unique()) for chunk in chunks], [[100], [200], [300]])
+        pd.testing.assert_frame_equal(pd.concat([chunk["flightlines"] for chunk in chunks]), full["flightlines"])
+        pd.testing.assert_frame_equal(pd.concat([chunk["layer_data"]["rho"] for chunk in chunks]),
+                                      full["layer_data"]["rho"])
+
+class TestParseHeader(unittest.TestCase):
+    def test_header(self):
+        path = test_raw_6602
+        full = libaarhusxyz.parse(path)
+        header = libaarhusxyz.parse_header(path)
+        self.assertEqual(header["model_info"], full["model_info"])
+        self.assertEqual(header["flightlines"], list(full["flightlines"].columns))
+        self.assertEqual(set(header["layer_data"].keys()), set(full["layer_data"].keys()))
+        self.assertEqual(header["file_meta"]["rows"], len(full["flightlines"]))
+        self.assertFalse(header["file_meta"]["rows_estimated"])
+
+    def test_row_estimate(self):
+        data = "/ line x rho_1 rho_2 rho_3\n" + "".join(" 100 %s 1 2 3\n" % (x % 10) for x in range(1000))
+        header = libaarhusxyz.parse_header(io.StringIO(data), sample_size=100)
+        self.assertTrue(header["file_meta"]["rows_estimated"])
+        self.assertAlmostEqual(header["file_meta"]["rows"], 1000, delta=100)
+
+class TestLineIndex(unittest.TestCase):
+    def test_lines(self):
+        data = "/ line x rho_1 rho_2\n" + "".join(
+            " %s %s 1 2\n" % (100 + x // 10 % 3, x) for x in range(100))
+        with TempDir() as tmpdir:
+            path = tmpdir.write("lines.xyz", data)
+            full = libaarhusxyz.parse(path)
+            parsed = libaarhusxyz.parse(path, lines=[100, 102])
+            self.assertTrue(os.path.exists(tmpdir.path("lines.xyzidx")))
+            expected = full["flightlines"].loc[full["flightlines"].line.isin([100, 102])].reset_index(drop=True)
+            pd.testing.assert_frame_equal(parsed["flightlines"], expected)
+            pd.testing.assert_frame_equal(
+                parsed["layer_data"]["rho"],
+                full["layer_data"]["rho"].loc[full["flightlines"].line.isin([100, 102])].reset_index(drop=True))
+            index = libaarhusxyz.build_index(path, save=False)
+            self.assertEqual(sum(run["rows"] for run in index["lines"]), 100)
+            with self.assertRaises(ValueError):
+                libaarhusxyz.parse(path, lines=[999])
+
+    def test_lines_alc(self):
+        data = "/ fid x rho_1 rho_2\n" + "".join(
+            " %s %s 1 2\n" % (100 + x // 10 % 3, x) for x in range(100))
+        with TempDir() as tmpdir:
+            path = tmpdir.write("lines.xyz", data)
+            alcfile = tmpdir.write("lines.alc", "Line = 1\nUTMX = 2\n")
+            # Without the ALC file there is no line id column
+            self.assertIsNone(libaarhusxyz.build_index(path)["line_column"])
+            parsed = libaarhusxyz.parse(path, alcfile=alcfile, lines=[100, 102])
+            self.assertEqual(list(parsed["flightlines"]["Line"].unique()), [100, 102])
+            self.assertEqual(len(parsed["flightlines"]), 70)
+            self.assertEqual(libaarhusxyz.xyzparser.load_index(path, alcfile=alcfile)["line_column"], "Line")
+            self.assertIsNone(libaarhusxyz.xyzparser.load_index(path)["line_column"])
+
+class TestDtypePolicy(unittest.TestCase):
+    def test_compact(self):
+        path = test_sci_inv_6602
+        full = libaarhusxyz.parse(path)
+        compact = libaarhusxyz.parse(path, dtype_policy="compact")
+        self.assertEqual(compact["flightlines"]["line_no"].dtype, np.int32)
+        for key, df in compact["layer_data"].items():
+            self.assertTrue((df.dtypes == np.float32).all())
+            np.testing.assert_allclose(df.values, full["layer_data"][key].values, rtol=1e-6)
+        self.assertGreater(compact["file_meta"]["memory_saved"], 0)
+        with self.assertRaises(ValueError):
+            libaarhusxyz.parse(path, dtype_policy="tiny")
+
+    def test_layer_params(self):
+        path = test_sci_inv_6602
+        full = libaarhusxyz.XYZ(path)
+        compact = libaarhusxyz.XYZ(path, dtype_policy="compact")
+        for xyz in (full, compact):
+            xyz.layer_data["rho_i"].iloc[:, :] = 10.5
+        self.assertEqual(compact.layer_data["rho_i"].dtypes.iloc[0], np.float32)
+        self.assertIn("rho_i", compact.layer_params.columns)
+        pd.testing.assert_frame_equal(compact.layer_params, full.layer_params, check_dtype=False)
+
+class TestParseMany(unittest.TestCase):
+    def test_parse_many(self):
+        paths = [test_raw_6602, test_avg_6602]
+        models = [libaarhusxyz.parse(path) for path in paths]
+        for workers in (1, 2):
+            xyz = libaarhusxyz.XYZ(paths, workers=workers)
+            self.assertEqual(list(xyz.flightlines.source_file), [paths[0]] * 3 + [paths[1]] * 3)
+            pd.testing.assert_frame_equal(
+                xyz.flightlines.drop(columns="source_file"),
+                pd.concat([model["flightlines"] for model in models], ignore_index=True))
+            for key in models[0]["layer_data"]:
+                pd.testing.assert_frame_equal(
+                    xyz.layer_data[key],
+                    pd.concat([model["layer_data"][key] for model in models], ignore_index=True))
+
+    def test_lazy(self):
+        with self.assertRaises(ValueError):
+            libaarhusxyz.XYZ([test_raw_6602, test_avg_6602], lazy=True)
+
+    def test_schema_mismatch(self):
+        paths = [test_sci_inv_6602, test_raw_6602]
+        with self.assertRaises(ValueError):
+            libaarhusxyz.parse_many(paths)
+
+class TestNanDummy(unittest.TestCase):
+    def test_nan_dummy(self):
+        path = test_avg_6602
+        raw = libaarhusxyz.XYZ(path)
+        self.assertTrue((raw.layer_data["dbdt_std_ch1gt"] == raw.model_info["dummy"]).values.any())
+        libaarhusxyz.normalizer.normalize_nans(raw)
+        for engine in ("auto", "python"):
+            parsed = libaarhusxyz.XYZ(path, engine=engine, nan_dummy=True)
+            self.assertTrue(parsed.file_meta["nan_dummy"])
+            pd.testing.assert_frame_equal(parsed.flightlines, raw.flightlines, check_dtype=False)
+            for key, df in raw.layer_data.items():
+                pd.testing.assert_frame_equal(parsed.layer_data[key], df, check_dtype=False)
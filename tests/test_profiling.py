@@ -0,0 +1,42 @@
+import unittest
+import libaarhusxyz
+import libaarhusxyz.profiling
+from utils import test_sci_inv_6602, TempDir
+
+class TestProfiling(unittest.TestCase):
+    def test_stages(self):
+        path = test_sci_inv_6602
+        seen = []
+        with libaarhusxyz.profiling.profile(callback=seen.append) as report:
+            xyz = libaarhusxyz.XYZ(path, normalize=True)
+            with TempDir() as tmpdir:
+                xyz.to_npy(tmpdir.path("store"))
+        stages = [stage["stage"] for stage in report]
+        self.assertEqual(seen, report.stages)
+        for name in ("parse.header", "parse.tokenize", "parse.convert", "parse.split", "parse",
+                     "normalize.naming", "normalize.z", "normalize", "export.npy"):
+            self.assertIn(name, stages)
+        parse = report.stages[stages.index("parse")]
+        self.assertEqual(parse["rows"], len(xyz.flightlines))
+        self.assertEqual(parse["depth"], 0)
+        self.assertGreaterEqual(parse["peak_memory"], report.stages[stages.index("parse.convert")]["peak_memory"])
+        self.assertEqual(list(report.to_frame().columns), libaarhusxyz.profiling.FIELDS)
+
+    def test_parse_paths(self):
+        data = "/ line x rho_1 rho_2\n" + "".join(
+            " %s %s 1 2\n" % (100 + x // 10 % 3, x) for x in range(100))
+        with TempDir() as tmpdir:
+            path = tmpdir.write("lines.xyz", data)
+            for kw in ({"workers": 2}, {"engine": "mmap"}, {"lines": [100, 102]}):
+                with libaarhusxyz.profiling.profile(memory=False) as report:
+                    model = libaarhusxyz.parse(path, **kw)
+                stages = {stage["stage"]: stage for stage in report}
+                for name in ("parse.header", "parse.tokenize", "parse.convert", "parse.split", "parse"):
+                    self.assertIn(name, stages)
+                self.assertEqual(stages["parse.tokenize"]["rows"], len(model["flightlines"]))
+                self.assertEqual(stages["parse.tokenize"]["depth"], 1)
+
+    def test_inactive(self):
+        with libaarhusxyz.profiling.stage("parse", rows=3) as info:
+            pass
+        self.assertEqual(info["rows"], 3)
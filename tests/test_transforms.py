@@ -0,0 +1,47 @@
+import unittest
+import libaarhusxyz
+import libaarhusxyz.transforms
+import numpy as np
+import pandas as pd
+
+class TestLayerDepths(unittest.TestCase):
+    def test_union_layers(self):
+        layer_data = {"dep_top": pd.DataFrame([[0, 5, 10], [0, 2, 4.]]),
+                      "dep_bot": pd.DataFrame([[5, 10, np.inf], [2, 4, 6.]]),
+                      "resistivity": pd.DataFrame([[1, 2, 3], [4, 5, 6.]])}
+        res = libaarhusxyz.transforms.normalize_layer_depths({"layer_data": layer_data})["layer_data"]
+        np.testing.assert_array_equal(res["dep_bot"].iloc[0], [2, 4, 5, 6, 10, np.inf])
+        np.testing.assert_array_equal(res["dep_top"].iloc[1], [0, 2, 4, 5, 6, 10])
+        np.testing.assert_array_equal(res["resistivity"].to_numpy(),
+                                      [[1, 1, 1, 2, 2, 3], [4, 5, 6, 6, np.nan, np.nan]])
+        self.assertEqual(res["resistivity"].dtypes.unique().tolist(), [np.float64])
+
+class TestResampleLayers(unittest.TestCase):
+    def setUp(self):
+        self.model = {
+            "flightlines": pd.DataFrame({"topo": [100., 50.]}),
+            "layer_data": {"dep_top": pd.DataFrame([[0, 5, 10], [0, 2, 4.]]),
+                           "dep_bot": pd.DataFrame([[5, 10, np.inf], [2, 4, 6.]]),
+                           "resistivity": pd.DataFrame([[1, 10, 100], [4, np.nan, 6.]])}}
+
+    def test_methods(self):
+        expected = {"nearest": [[1, 10, 10], [4, 6, np.nan]],
+                    "thickness": [[1, 7.75, 55], [4, 6, np.nan]],
+                    "log": [[1, 10 ** 0.75, 10 ** 1.5], [4, 6, np.nan]]}
+        for method, values in expected.items():
+            res = libaarhusxyz.transforms.resample_layers(self.model, np.arange(0, 14, 4), method=method)
+            np.testing.assert_allclose(res["layer_data"]["resistivity"].to_numpy(), values)
+            np.testing.assert_array_equal(res["layer_data"]["dep_bot"].iloc[1], [4, 8, 12])
+
+    def test_elevation(self):
+        res = libaarhusxyz.transforms.resample_layers(
+            self.model, [100, 96, 92], method="thickness", elevation="topo")["layer_data"]
+        np.testing.assert_allclose(res["resistivity"].to_numpy(), [[1, 7.75], [np.nan, np.nan]])
+        np.testing.assert_array_equal(res["dep_top"].iloc[1], [-50, -46])
+        np.testing.assert_array_equal(res["z_bottom"].iloc[0], [96, 92])
+
+    def test_errors(self):
+        with self.assertRaises(ValueError):
+            libaarhusxyz.transforms.resample_layers(self.model, [0, 4], method="median")
+        with self.assertRaises(ValueError):
+            libaarhusxyz.transforms.resample_layers(self.model, [4, 0])
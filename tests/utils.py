@@ -6,6 +6,7 @@ import os.path
 import pandas as pd
 import numpy as np
 import copy
+import tempfile
 
 test_basedir = os.path.dirname(__file__)
 test_datadir_wb_5940 = os.path.join(test_basedir, "data/aarhus_workbench.5.9.4.0")
@@ -18,6 +19,30 @@ test_datadir_wb_6602 = os.path.join(test_basedir, "data/aarhus_workbench.6.6.0.2
 test_datadir_wb_6700 = os.path.join(test_basedir, "data/aarhus_workbench.6.7.0.0")
 test_datadir_skytem = os.path.join(test_basedir, "data/skytem")
 
+test_sci_inv_6602 = os.path.join(test_datadir_wb_6602, "SCI_1_Pro3_MOD_inv_example_SCI_inversion_export.xyz")
+test_raw_6602 = os.path.join(test_datadir_wb_6602, "RAW_export_example_averagde_data_export.xyz")
+test_avg_6602 = os.path.join(test_datadir_wb_6602, "AVG_export_example_averagde_data_export.xyz")
+
+class TempDir(object):
+    """A temporary directory for the duration of a with block."""
+    def __enter__(self):
+        self._tmpdir = tempfile.TemporaryDirectory()
+        self.name = self._tmpdir.name
+        return self
+
+    def __exit__(self, *exc):
+        self._tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.name, name)
+
+    def write(self, name, data):
+        """Writes the text data to the file name, and returns its path."""
+        path = self.path(name)
+        with open(path, "w") as f:
+            f.write(data)
+        return path
+
 class Difference(object):
     def __init__(self, path, diff, a, b):
         self.path = path
@@ -97,6 +122,7 @@ class TestSkytem(unittest.TestCase):
                                   alcfile=os.path.join(test_datadir_skytem, "2022.02.test.alc")).model_dict
         fixture = downfile.parse(os.path.join(test_datadir_skytem, "2022.02.test.down"))
         del parsed["model_info"]["source"]
+        del parsed["file_meta"]["engine"]
         del fixture["model_info"]["source"]
 
         for diff in compare(parsed, fixture):
@@ -107,6 +133,7 @@ class TestAarhusWorkbench6602(unittest.TestCase):
         parsed = libaarhusxyz.XYZ(os.path.join(test_datadir_wb_6602, "RAW_export_example_averagde_data_export.xyz")).model_dict
         fixture = downfile.parse(os.path.join(test_datadir_wb_6602, "RAW_export_example_averagde_data_export.down"))
         del parsed["model_info"]["source"]
+        del parsed["file_meta"]["engine"]
         del fixture["model_info"]["source"]
 
         for diff in compare(parsed, fixture):
@@ -116,6 +143,7 @@ class TestAarhusWorkbench6602(unittest.TestCase):
         parsed = libaarhusxyz.XYZ(os.path.join(test_datadir_wb_6602, "AVG_export_example_averagde_data_export.xyz")).model_dict
         fixture = downfile.parse(os.path.join(test_datadir_wb_6602, "AVG_export_example_averagde_data_export.down"))
         del parsed["model_info"]["source"]
+        del parsed["file_meta"]["engine"]
         del fixture["model_info"]["source"]
 
         for diff in compare(parsed, fixture):
@@ -125,6 +153,7 @@ class TestAarhusWorkbench6602(unittest.TestCase):
         parsed = libaarhusxyz.XYZ(os.path.join(test_datadir_wb_6602, "SCI_1_Pro3_MOD_dat_example_SCI_inversion_export.xyz")).model_dict
         fixture = downfile.parse(os.path.join(test_datadir_wb_6602, "SCI_1_Pro3_MOD_dat_example_SCI_inversion_export.down"))
         del parsed["model_info"]["source"]
+        del parsed["file_meta"]["engine"]
         del fixture["model_info"]["source"]
 
         for diff in compare(parsed, fixture):
@@ -134,6 +163,7 @@ class TestAarhusWorkbench6602(unittest.TestCase):
         parsed = libaarhusxyz.XYZ(os.path.join(test_datadir_wb_6602, "SCI_1_Pro3_MOD_inv_example_SCI_inversion_export.xyz")).model_dict
         fixture = downfile.parse(os.path.join(test_datadir_wb_6602, "SCI_1_Pro3_MOD_inv_example_SCI_inversion_export.down"))
         del parsed["model_info"]["source"]
+        del parsed["file_meta"]["engine"]
         del fixture["model_info"]["source"]
 
         for diff in compare(parsed, fixture):
@@ -143,6 +173,7 @@ class TestAarhusWorkbench6602(unittest.TestCase):
         parsed = libaarhusxyz.XYZ(os.path.join(test_datadir_wb_6602, "SCI_1_Pro3_MOD_syn_example_SCI_inversion_export.xyz")).model_dict
         fixture = downfile.parse(os.path.join(test_datadir_wb_6602, "SCI_1_Pro3_MOD_syn_example_SCI_inversion_export.down"))
         del parsed["model_info"]["source"]
+        del parsed["file_meta"]["engine"]
         del fixture["model_info"]["source"]
 
         for diff in compare(parsed, fixture):